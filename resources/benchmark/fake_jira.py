@@ -0,0 +1,201 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import re
+import threading
+import time
+
+# A local stand-in for the parts of the Jira REST API that the scripts in resources/jira use, serving synthetic issues
+# with a fixed delay per request, so the scripts can be benchmarked without a Jira server and without network noise.
+
+STATES = ["New", "Todo", "In Progress", "Review", "Ready for QA", "Done", "Rejected"]
+TYPES = ["Bug", "Story", "Task", "Epic", "Test"]
+LABELS = [[], ["TO_REFINE"], ["UI"], ["Backend", "UI"], ["Firmware"]]
+# The workflow the synthetic issues move through during a sprint, one step per history.
+FLOW = ["Todo", "In Progress", "Review", "Ready for QA", "Done"]
+
+SPRINT_START = "2026-10-05T08:00:00.000+0000"
+SPRINT_END = "2026-10-19T08:00:00.000+0000"
+MAX_SEARCH_RESULTS = 100  # Like Jira Cloud, larger pages are lowered to this.
+MAX_CHANGELOG_RESULTS = 5  # Histories included per issue in a search, the remaining ones come from issue/{key}/changelog.
+
+
+def _field(field_id: str, name: str, clause_names: List[str], schema_type: str, custom: bool = False) -> Dict[str, Any]:
+    return {"id": field_id, "key": field_id, "name": name, "custom": custom, "orderable": True, "navigable": True,
+            "searchable": True, "clauseNames": clause_names, "schema": {"type": schema_type}}
+
+
+# The definitions of the fields the scripts request. The jira client fetches them once and translates the requested
+# field names with their clauseNames, an empty list would make it fetch them again for every search.
+FIELDS = [
+    _field("issuekey", "Key", ["id", "issue", "issuekey", "key"], "string"),
+    _field("summary", "Summary", ["summary"], "string"),
+    _field("issuetype", "Issue Type", ["issuetype", "type"], "issuetype"),
+    _field("status", "Status", ["status"], "status"),
+    _field("labels", "Labels", ["labels"], "array"),
+    _field("created", "Created", ["created", "createdDate"], "datetime"),
+    _field("updated", "Updated", ["updated", "updatedDate"], "datetime"),
+    _field("customfield_10028", "Story Points", ["cf[10028]", "Story Points"], "number", custom=True),
+]
+
+
+class FakeJira:
+
+    def __init__(self, num_issues: int, num_boards: int = 1, sprints_per_board: int = 1, delay: float = 0.0) -> None:
+        self.num_issues = num_issues
+        self.num_boards = num_boards
+        self.sprints_per_board = sprints_per_board
+        self.delay = delay
+        self.num_requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def sprint_ids(self) -> List[int]:
+        return [board_id * 100 + idx for board_id in self.board_ids for idx in range(self.sprints_per_board)]
+
+    @property
+    def board_ids(self) -> List[int]:
+        return list(range(1, self.num_boards + 1))
+
+    def start(self, port: int = 0) -> "FakeJira":
+        fake_jira = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                status, body = fake_jira.handle(url.path, params)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_POST = do_GET
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), RequestHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, path: str, params: Dict[str, str]):
+        with self._lock:
+            self.num_requests += 1
+        time.sleep(self.delay)
+
+        if path.endswith("/serverInfo"):
+            return 200, {"baseUrl": self.url, "version": "1001.0.0", "versionNumbers": [1001, 0, 0], "deploymentType": "Cloud"}
+        if path.endswith("/field"):
+            return 200, FIELDS
+        if path.endswith("/search"):
+            return 200, self._search(params)
+
+        match = re.search(r"/board/(\d+)/sprint$", path)
+        if match:
+            return 200, self._sprints(int(match.group(1)), params)
+        match = re.search(r"/issue/[A-Z]+-(\d+)/changelog$", path)
+        if match:
+            histories = self._histories(int(match.group(1)) - 1)
+            start_at = int(params.get("startAt", 0))
+            max_results = int(params.get("maxResults", 100))
+            values = histories[start_at:start_at + max_results]
+            return 200, {"startAt": start_at, "maxResults": max_results, "total": len(histories), "values": values}
+        return 404, {"errorMessages": [f"Not found: {path}"]}
+
+    def _sprints(self, board_id: int, params: Dict[str, str]) -> Dict[str, Any]:
+        sprints = [
+            {"id": sprint_id, "name": f"Sprint {sprint_id}", "state": "active", "startDate": SPRINT_START,
+             "endDate": SPRINT_END, "originBoardId": board_id}
+            for sprint_id in self.sprint_ids if sprint_id // 100 == board_id
+        ]
+        return {"startAt": 0, "maxResults": len(sprints), "total": len(sprints), "isLast": True, "values": sprints}
+
+    def _search(self, params: Dict[str, str]) -> Dict[str, Any]:
+        indexes = range(self.num_issues)
+        match = re.search(r"Sprint\s*=\s*(\d+)", params.get("jql", ""))
+        if match:
+            # The issues are spread over the sprints.
+            sprint_ids = self.sprint_ids
+            sprint_idx = sprint_ids.index(int(match.group(1))) if int(match.group(1)) in sprint_ids else -1
+            indexes = [idx for idx in indexes if idx % len(sprint_ids) == sprint_idx]
+
+        start_at = int(params.get("startAt", 0))
+        max_results = min(int(params.get("maxResults", 50)), MAX_SEARCH_RESULTS)
+        expand_changelog = "changelog" in params.get("expand", "")
+        issues = [self._issue(idx, expand_changelog) for idx in indexes[start_at:start_at + max_results]]
+        return {"startAt": start_at, "maxResults": max_results, "total": len(indexes), "issues": issues}
+
+    def _issue(self, idx: int, expand_changelog: bool) -> Dict[str, Any]:
+        histories = self._histories(idx)
+        status = histories[-1]["items"][0]["toString"] if histories else STATES[idx % len(STATES)]
+        issue = {
+            "id": str(10000 + idx),
+            "key": f"PRJ-{idx + 1}",
+            "self": f"{self.url}rest/api/2/issue/{10000 + idx}",
+            "fields": {
+                "summary": f"Synthetic issue {idx + 1}",
+                "issuetype": {"name": TYPES[idx % len(TYPES)]},
+                "status": {"name": status},
+                "labels": LABELS[idx % len(LABELS)],
+                "customfield_10028": float(idx % 8) if idx % 3 else None,
+                "created": "2026-10-01T09:00:00.000+0000",
+                "updated": "2026-10-01T09:00:00.000+0000",
+            },
+        }
+        if expand_changelog:
+            issue["changelog"] = {
+                "startAt": 0, "maxResults": MAX_CHANGELOG_RESULTS, "total": len(histories),
+                "histories": histories[-MAX_CHANGELOG_RESULTS:]
+            }
+        return issue
+
+    @staticmethod
+    def _histories(idx: int) -> List[Dict[str, Any]]:
+        # Every issue moves idx % 8 steps through the workflow (back to the start after done), one step per day.
+        histories = []
+        for step in range(idx % 8):
+            from_status, to_status = FLOW[step % len(FLOW)], FLOW[(step + 1) % len(FLOW)]
+            histories.append({
+                "id": str(idx * 100 + step),
+                "created": f"2026-10-{6 + step:02d}T{9 + idx % 8:02d}:00:00.000+0000",
+                "items": [{"field": "status", "fromString": from_status, "toString": to_status}],
+            })
+        return histories
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve synthetic issues like the Jira REST API does")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--issues", type=int, default=1000, help="Number of issues in the project")
+    parser.add_argument("--boards", type=int, default=1, help="Number of boards, each with --sprints active sprints")
+    parser.add_argument("--sprints", type=int, default=1)
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds before answering each request")
+    args = parser.parse_args()
+
+    fake_jira = FakeJira(args.issues, args.boards, args.sprints, args.delay).start(args.port)
+    print(f"Serving {args.issues} issues on {fake_jira.url} (boards {fake_jira.board_ids}, sprints {fake_jira.sprint_ids})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake_jira.stop()
+
+
+if __name__ == "__main__":
+    main()
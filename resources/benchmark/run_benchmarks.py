@@ -0,0 +1,360 @@
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Benchmarks of the lint and Jira reporting tools in resources/ on synthetic data: a generated Python tree, a generated
+# Jira CSV export and a local fake Jira server (fake_jira.py). Every benchmark runs in its own Python process, so the
+# peak memory is its own, and the results are appended to a JSON lines file together with the git commit, so a change
+# can be compared with the commits before it.
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESOURCES_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+sys.path[:0] = [os.path.join(RESOURCES_DIRECTORY, "python"), os.path.join(RESOURCES_DIRECTORY, "jira")]
+
+# Sizes at --scale 1.
+NUM_PYTHON_FILES = 200
+NUM_EXPORT_ROWS = 200000
+NUM_JIRA_ISSUES = 3000
+NUM_BOARDS = 3
+SPRINTS_PER_BOARD = 2
+
+
+# --- Synthetic data
+
+PYTHON_FILE_TEMPLATE = '''# Synthetic module {idx} for the style checker benchmark.
+import os
+import sys
+from typing import List, Optional
+
+
+class Repository{idx}:
+    MAX_ITEMS = {idx}
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._items = []  # type: List[str]
+
+    def getName(self) -> str:
+        return self._name
+
+    def addItem(self, item: str) -> None:
+        if item not in self._items:
+            self._items.append(item)
+
+    def find_item(self, prefix: str) -> Optional[str]:
+        for item in self._items:
+            if item.startswith(prefix):
+                return item
+        return None
+'''
+
+PYTHON_FUNCTION_TEMPLATE = '''
+
+def computeValue{idx}(values: List[int], scale: float = 1.0) -> float:
+    total = 0
+    for value in values:
+        total += value * scale
+    BadName = total / max(len(values), 1)
+    return BadName
+'''
+
+
+def write_python_tree(directory: str, num_files: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for idx in range(num_files):
+        package = os.path.join(directory, f"package_{idx % 10}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"module_{idx}.py"), "w") as python_file:
+            python_file.write(PYTHON_FILE_TEMPLATE.format(idx=idx))
+            for function_idx in range(rng.randint(5, 15)):
+                python_file.write(PYTHON_FUNCTION_TEMPLATE.format(idx=function_idx))
+
+
+def prepare_data(directory: str, scale: float) -> Dict[str, Any]:
+    from backlog_benchmark import write_export
+
+    python_directory = os.path.join(directory, "python_tree")
+    write_python_tree(python_directory, max(1, int(NUM_PYTHON_FILES * scale)))
+    export_file = os.path.join(directory, "export.csv")
+    write_export(export_file, max(1, int(NUM_EXPORT_ROWS * scale)), 0)
+    return {"python_directory": python_directory, "export_file": export_file}
+
+
+# --- Benchmarks, each returns its metrics. They run in the benchmark process, see run_benchmark().
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def _latency_metrics(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    return {"latency_p50_ms": _percentile(latencies, 50) * 1000, "latency_p95_ms": _percentile(latencies, 95) * 1000}
+
+
+def _find_python_files(config: Dict[str, Any]) -> Tuple[List[str], int]:
+    import pep8_check_python
+
+    paths = pep8_check_python.findPythonFiles([config["python_directory"]], pep8_check_python.DEFAULT_EXCLUDES, False)
+    num_lines = 0
+    for path in paths:
+        with open(path) as python_file:
+            num_lines += sum(1 for _ in python_file)
+    return paths, num_lines
+
+
+def _benchmark_lint(config: Dict[str, Any], naming_engine: str) -> Dict[str, float]:
+    import pep8_check_python
+
+    paths, num_lines = _find_python_files(config)
+    xml_file = os.path.join(config["work_directory"], f"lint_{naming_engine}.xml")
+    style_guide = pep8_check_python.createStyleGuide(pep8_check_python.XmlReport, None, None, naming_engine, xml_file)
+
+    start = time.perf_counter()
+    report = style_guide.check_files(paths)
+    report.close()
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "files_per_s": len(paths) / seconds, "lines_per_s": num_lines / seconds, "violations": report.get_count()}
+
+
+def benchmark_lint_tokens(config: Dict[str, Any]) -> Dict[str, float]:
+    return _benchmark_lint(config, "tokens")
+
+
+def benchmark_lint_ast(config: Dict[str, Any]) -> Dict[str, float]:
+    return _benchmark_lint(config, "ast")
+
+
+def benchmark_lint_server(config: Dict[str, Any]) -> Dict[str, float]:
+    import pep8_check_python
+
+    paths, _ = _find_python_files(config)
+    socket_path = os.path.join(config["work_directory"], f"lint_{time.perf_counter_ns()}.sock")
+    server = pep8_check_python.LintServer(pep8_check_python.createStyleGuide(), 3600)
+    threading.Thread(target=server.serve, args=(socket_path,), daemon=True).start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    sources = []
+    for path in paths:
+        with open(path) as python_file:
+            sources.append((path, python_file.read()))
+
+    latencies = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        responses = client.makefile("rb")
+        start = time.perf_counter()
+        for path, source in sources:
+            request_start = time.perf_counter()
+            client.sendall(json.dumps({"path": path, "source": source}).encode("utf-8") + b"\n")
+            json.loads(responses.readline().decode("utf-8"))
+            latencies.append(time.perf_counter() - request_start)
+        seconds = time.perf_counter() - start
+    return dict({"seconds": seconds, "requests_per_s": len(sources) / seconds}, **_latency_metrics(latencies))
+
+
+def _benchmark_export(config: Dict[str, Any], engine: str) -> Dict[str, float]:
+    from backlog_report import report_from_export
+
+    start = time.perf_counter()
+    report = report_from_export(config["export_file"], engine)
+    seconds = time.perf_counter() - start
+    num_rows = sum(report.states.values())
+    return {"seconds": seconds, "rows_per_s": num_rows / seconds}
+
+
+def benchmark_export_rows(config: Dict[str, Any]) -> Dict[str, float]:
+    return _benchmark_export(config, "rows")
+
+
+def benchmark_export_pandas(config: Dict[str, Any]) -> Dict[str, float]:
+    return _benchmark_export(config, "pandas")
+
+
+def _record_latencies(jira: Any) -> List[float]:
+    latencies: List[float] = []
+    jira._session.hooks["response"].append(lambda response, *args, **kwargs: latencies.append(response.elapsed.total_seconds()))
+    return latencies
+
+
+def benchmark_jira_backlog(config: Dict[str, Any]) -> Dict[str, float]:
+    from backlog_report import JiraReport
+
+    jira_report = JiraReport("", "", "PRJ", config["jira_url"])
+    latencies = _record_latencies(jira_report._jira)
+
+    start = time.perf_counter()
+    report = jira_report.create()
+    seconds = time.perf_counter() - start
+    num_issues = sum(report.states.values())
+    return dict({"seconds": seconds, "issues_per_s": num_issues / seconds, "requests": len(latencies)}, **_latency_metrics(latencies))
+
+
+def _create_progress_monitor(config: Dict[str, Any]) -> Any:
+    from days_in_sprint import ProgressMonitor
+    from snapshot_store import SnapshotStore
+
+    snapshot_file = os.path.join(config["work_directory"], f"snapshots_{os.getpid()}_{time.perf_counter_ns()}.sqlite")
+    return ProgressMonitor("", "", config["board_ids"][0], SnapshotStore(snapshot_file), None, config["jira_url"])
+
+
+def benchmark_sprint_monitor(config: Dict[str, Any]) -> Dict[str, float]:
+    progress_monitor = _create_progress_monitor(config)
+    latencies = _record_latencies(progress_monitor._jira)
+
+    start = time.perf_counter()
+    graphs = progress_monitor.monitor_days_in_active_sprints_of_boards(config["board_ids"])
+    fetched = time.perf_counter()
+    for data_frame, sprint in graphs:
+        progress_monitor.render_graph(data_frame, os.path.join(config["work_directory"], f"days_in_{sprint.id}.png"))
+    seconds = time.perf_counter() - start
+    return dict({"seconds": seconds, "render_seconds": seconds - (fetched - start), "sprints": len(graphs), "requests": len(latencies)}, **_latency_metrics(latencies))
+
+
+def benchmark_sprint_flow(config: Dict[str, Any]) -> Dict[str, float]:
+    progress_monitor = _create_progress_monitor(config)
+    latencies = _record_latencies(progress_monitor._jira)
+
+    start = time.perf_counter()
+    flows = progress_monitor.monitor_flow_in_active_sprints_of_boards(config["board_ids"])
+    seconds = time.perf_counter() - start
+    num_issues = sum(len(flow.time_in_status) for flow, _ in flows)
+    return dict({"seconds": seconds, "issues_per_s": num_issues / seconds, "requests": len(latencies)}, **_latency_metrics(latencies))
+
+
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Dict[str, float]]] = {
+    "lint-tokens": benchmark_lint_tokens,
+    "lint-ast": benchmark_lint_ast,
+    "lint-server": benchmark_lint_server,
+    "export-rows": benchmark_export_rows,
+    "export-pandas": benchmark_export_pandas,
+    "jira-backlog": benchmark_jira_backlog,
+    "sprint-monitor": benchmark_sprint_monitor,
+    "sprint-flow": benchmark_sprint_flow,
+}
+
+
+def _peak_rss_mb() -> float:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+# Runs a benchmark repeat times in this process and prints the metrics of the fastest run as JSON.
+def run_benchmark(name: str, config: Dict[str, Any], repeat: int) -> None:
+    runs = []
+    with redirect_stdout(io.StringIO()):  # The tools print their progress and results.
+        for _ in range(repeat):
+            runs.append(BENCHMARKS[name](config))
+    metrics = min(runs, key=lambda run: run["seconds"])
+    metrics["peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps(metrics))
+
+
+# --- Running and storing
+
+def get_commit() -> Tuple[str, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCHMARK_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status.strip())
+
+
+def load_results(results_file: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+# The latest results per benchmark of the baseline commit, by default the latest other commit in the results file.
+def get_baseline(results: List[Dict[str, Any]], commit: str, scale: float, baseline_commit: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    results = [result for result in results if result["scale"] == scale]
+    if baseline_commit is None:
+        other_commits = [result["commit"] for result in results if result["commit"] != commit]
+        if not other_commits:
+            return {}
+        baseline_commit = other_commits[-1]
+    return {result["benchmark"]: result for result in results if result["commit"] == baseline_commit}
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    if baseline:
+        print(f"Compared with {next(iter(baseline.values()))['commit']}:")
+    print(f"{'benchmark':16} {'seconds':>9} {'change':>8} {'peak MB':>9} {'p95 ms':>8}  throughput")
+    for result in results:
+        change = ""
+        if result["benchmark"] in baseline:
+            change = f"{(result['seconds'] / baseline[result['benchmark']]['seconds'] - 1) * 100:+.1f}%"
+        throughput = ", ".join(f"{key} {value:.0f}" for key, value in result.items() if key.endswith("_per_s"))
+        latency = f"{result['latency_p95_ms']:.1f}" if "latency_p95_ms" in result else ""
+        print(f"{result['benchmark']:16} {result['seconds']:9.3f} {change:>8} {result['peak_rss_mb']:9.1f} {latency:>8}  {throughput}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the lint and Jira reporting tools on synthetic data")
+    parser.add_argument("benchmarks", nargs="*", choices=[[]] + list(BENCHMARKS), help="Benchmarks to run, all by default")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size of the synthetic data, relative to the default sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per benchmark to take the fastest of")
+    parser.add_argument("--delay", type=float, default=0.02, help="Seconds the fake Jira server waits before each response")
+    parser.add_argument("--results", type=str, default=os.path.join(BENCHMARK_DIRECTORY, "benchmark_results.jsonl"), help="JSON lines file to append the results to")
+    parser.add_argument("--baseline", type=str, help="Commit to compare with, by default the latest other commit in the results")
+    parser.add_argument("--no-store", action="store_true", help="Only print the results")
+    parser.add_argument("--run", type=str, help=argparse.SUPPRESS)  # Runs one benchmark, in the process for that benchmark.
+    parser.add_argument("--config", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_benchmark(args.run, json.loads(args.config), args.repeat)
+        return 0
+
+    from fake_jira import FakeJira
+
+    commit, dirty = get_commit()
+    names = args.benchmarks or list(BENCHMARKS)
+    results = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        print(f"Generating synthetic data (scale {args.scale})")
+        config = prepare_data(work_directory, args.scale)
+        fake_jira = FakeJira(max(1, int(NUM_JIRA_ISSUES * args.scale)), NUM_BOARDS, SPRINTS_PER_BOARD, args.delay).start()
+        config.update({"work_directory": work_directory, "jira_url": fake_jira.url, "board_ids": fake_jira.board_ids})
+
+        for name in names:
+            print(f"Running {name}")
+            benchmark = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", name, "--config", json.dumps(config), "--repeat", str(args.repeat)],
+                stdout=subprocess.PIPE, universal_newlines=True, check=True
+            )
+            metrics = json.loads(benchmark.stdout.strip().splitlines()[-1])
+            results.append(dict({
+                "benchmark": name, "commit": commit, "dirty": dirty, "date": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0], "scale": args.scale, "repeat": args.repeat
+            }, **metrics))
+        fake_jira.stop()
+
+    print_results(results, get_baseline(load_results(args.results), commit, args.scale, args.baseline))
+    if not args.no_store:
+        with open(args.results, "a") as results_file:
+            for result in results:
+                results_file.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
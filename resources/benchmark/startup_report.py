@@ -0,0 +1,76 @@
+from typing import Dict, List, NamedTuple, Tuple
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Startup time of the Jira scripts in resources/jira: each command is started with python -X importtime, and the report
+# lists the wall time of the command with the modules that took the longest to import, as imported by the script.
+
+JIRA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jira")
+
+
+class StartupResult(NamedTuple):
+    name: str
+    seconds: float
+    import_seconds: float
+    # The modules imported directly by the script or by a lazy import, with their cumulative import time in seconds.
+    imports: List[Tuple[str, float]]
+
+
+def parse_importtime(output: str) -> List[Tuple[str, float]]:
+    # Lines look like "import time:       412 |       9671 | pandas", nested imports are indented by 2 more spaces.
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            continue  # Only the top level imports.
+        imports.append((name.strip(), int(cumulative) / 1e6))
+    return imports
+
+
+def measure_startup(name: str, arguments: List[str], env: Dict[str, str]) -> StartupResult:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments, cwd=JIRA_DIRECTORY, env=dict(os.environ, **env),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    seconds = time.perf_counter() - start
+    imports = parse_importtime(result.stderr)
+    imports.sort(key=lambda i: -i[1])
+    return StartupResult(name, seconds, sum(seconds for _, seconds in imports), imports)
+
+
+def get_commands(cache_file: str) -> List[Tuple[str, List[str], Dict[str, str]]]:
+    return [
+        ("days_in_sprint.py --help", ["days_in_sprint.py", "--help"], {}),
+        ("backlog-overview_api.py --help", ["backlog-overview_api.py", "--help"], {}),
+        ("backlog-overview.py --help", ["backlog-overview.py", "--help"], {}),
+        # Starting a report from the local copy without contacting Jira, which is empty, so it stops with the error that
+        # the project was never synced.
+        ("backlog-overview_api.py offline", ["backlog-overview_api.py"], {"JIRA_CACHE_FILE": cache_file, "JIRA_OFFLINE": "1"}),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Report the startup time of the Jira scripts, using python -X importtime")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to list per command")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per command to take the fastest of")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, arguments, env in get_commands(os.path.join(directory, "issues.sqlite")):
+            results = [measure_startup(name, arguments, env) for _ in range(args.repeat)]
+            result = min(results, key=lambda r: r.seconds)
+            print(f"{result.name}: {result.seconds:.3f} s, of which {result.import_seconds:.3f} s imports")
+            for module, seconds in result.imports[:args.top]:
+                print(f"\t{module}: {seconds:.3f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
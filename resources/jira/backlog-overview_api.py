@@ -1,120 +1,86 @@
-from collections import defaultdict
-from typing import Dict, List
+from contextlib import redirect_stdout
+import argparse
+import json
 import os
-
-from jira import JIRA
-from jira.resources import Issue
-from jira.client import ResultList
-
-
-class JiraReport():
-
-    PAGE_SIZE = 50
-
-    def __init__(self, api_key: str, api_usr: str, project_id: str) -> None:
-        self._num_issues = 0
-        self._total = 1
-        self._issues: List[Issue] = []
-
-        self._labels: Dict[str, int] = defaultdict(int)
-        self._sp_count = 0.0
-
-        self._types: Dict[str, int] = defaultdict(int)
-        self._states: Dict[str, int] = defaultdict(int)
-
-        self._project_id = project_id
-        self._jira = JIRA(
-            'https://ultimaker.atlassian.net/',
-            basic_auth=(api_user, api_key)
-        )
-
-
-    def _grab_issues(self) -> None:
-        while self._num_issues < self._total:
-            print(f"Grabbing {self._num_issues}-{self._num_issues+self.PAGE_SIZE} ({self._total})")
-            all_project_issues: ResultList[Issue] = self._jira.search_issues(
-                f'project = {self._project_id}',
-                startAt=self._num_issues,
-                maxResults=self.PAGE_SIZE
-            )
-
-            for issue in all_project_issues:
-                self._issues.append(issue)
-
-            self._num_issues += len(all_project_issues)
-            self._total = all_project_issues.total
-
-    def _log_findings(self) -> None:
-        sorted_labels = list(self._labels.items())
-        sorted_labels.sort(key=lambda i: -i[1])
-
-        print("Labels:")
-        for name, count in sorted_labels:
-            print(f"\t{name or 'N.A'}: {count}")
-        print("Types:")
-        total_types = 0
-
-        for name, count in self._types.items():
-            print("\t%s: %s" % (name, count))
-            total_types += count
-        print("\tTOTAL %s" % total_types)
-
-        print("States:")
-        for name, count in self._states.items():
-            print("\t%s: %s" % (name, count))
-
-        print("To refine: %d" % self._labels["to_refine"])
-        print("Total SP: %d" % self._sp_count)
-
-    def _is_reject_type(self, issue: Issue) -> bool:
-        issue_type = issue.fields.issuetype.name.lower()
-
-        if issue_type in ("test", "epic"):
-            return True
-
-        self._types[issue_type] += 1
-
-        return False
-
-    def _is_reject_status(self, issue: Issue) -> bool:
-        status = issue.fields.status.name.lower()  # line_elts[status_idx]
-        self._states[status] += 1
-
-        if status not in ("new", "todo", "in progress", "review", "ready for qa"):
-
-            if status not in ("done", "rejected"):
-                print(f"Ignored status [{status}] > {issue.key}")
-
-            return True
-
-        return False
-
-    def _count_points_2(self, issue: Issue) -> None:
-        self._sp_count += float(issue.fields.customfield_10028 or "0")
-
-    def _count_labels_2(self, issue: Issue) -> None:
-        for label in issue.fields.labels:
-            label = label.lower()
-            self._labels[label] += 1
-
-    def create(self) -> None:
-        self._grab_issues()
-
-        for issue in self._issues:
-
-            if self._is_reject_status(issue) or self._is_reject_type(issue):
-                continue
-
-            self._count_labels_2(issue)
-            self._count_points_2(issue)
-
-        self._log_findings()
-
-
-# -----------------------
-api_key = os.environ.get("JIRA_API_KEY", "")
-api_user = os.environ.get("JIRA_API_USR", "")
-prj_id = os.environ.get("JIRA_PRJ_ID", "")
-
-jira_report = JiraReport(api_key, api_user, prj_id)
-jira_report.create()
+import sys
+
+from backlog_report import BacklogReport, reports_from_jira
+from issue_store import IssueStore
+
+
+def _log_findings(report: BacklogReport) -> None:
+    sorted_labels = list(report.labels.items())
+    sorted_labels.sort(key=lambda i: -i[1])
+
+    print("Labels:")
+    for name, count in sorted_labels:
+        print(f"\t{name or 'N.A'}: {count}")
+    print("Types:")
+    total_types = 0
+
+    for name, count in report.types.items():
+        print("\t%s: %s" % (name, count))
+        total_types += count
+    print("\tTOTAL %s" % total_types)
+
+    print("States:")
+    for name, count in report.states.items():
+        print("\t%s: %s" % (name, count))
+
+    print("To refine: %d" % report.to_refine)
+    print("Total SP: %d" % report.story_points)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Overview of the backlog of a Jira project, see README.md for the environment variables")
+    parser.add_argument("projects", nargs="*", help="Keys of the projects, instead of the comma separated keys in JIRA_PRJ_ID")
+    parser.add_argument("--json", action="store_true", help="Print the overview as JSON, the progress is printed to stderr")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("JIRA_API_KEY", "")
+    api_user = os.environ.get("JIRA_API_USR", "")
+    prj_ids = args.projects or os.environ.get("JIRA_PRJ_ID", "").split(",")
+    server = os.environ.get("JIRA_SERVER", "https://ultimaker.atlassian.net/")
+    max_concurrent_requests = int(os.environ.get("JIRA_MAX_CONCURRENT_REQUESTS", 8))
+    cache_file = os.environ.get("JIRA_CACHE_FILE", "")
+    offline = os.environ.get("JIRA_OFFLINE", "") == "1"
+    engine = os.environ.get("BACKLOG_ENGINE", "rows")
+
+    if offline and not cache_file:
+        raise SystemExit("JIRA_OFFLINE requires JIRA_CACHE_FILE")
+    store = IssueStore(cache_file) if cache_file else None
+
+    # Several projects are fetched concurrently, each gets its own overview, followed by the overview of all of them.
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        try:
+            reports = reports_from_jira(api_key, api_user, prj_ids, server, max_concurrent_requests, store, offline, engine)
+        except LookupError as e:
+            raise SystemExit(e)
+
+    if len(reports) == 1:
+        report = next(iter(reports.values()))
+        if args.json:
+            print(json.dumps(report.to_json(), indent=4))
+        else:
+            _log_findings(report)
+    elif args.json:
+        print(json.dumps({
+            "projects": {prj_id: report.to_json() for prj_id, report in reports.items()},
+            "all": BacklogReport.combine(reports.values()).to_json()
+        }, indent=4))
+    else:
+        for prj_id, report in reports.items():
+            print(f"Project {prj_id}:")
+            _log_findings(report)
+        print("All projects:")
+        _log_findings(BacklogReport.combine(reports.values()))
+
+    if not offline:  # Offline runs do not import the Jira client at all.
+        from jira_client import report_metrics
+
+        report_metrics(os.environ.get("JIRA_METRICS_FILE", ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
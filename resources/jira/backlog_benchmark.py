@@ -0,0 +1,75 @@
+from typing import List
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmark of the row by row and the pandas engine of backlog-overview.py on a synthetic Jira CSV export.
+# Both engines run as the script would be run, so the times include starting Python and importing pandas.
+
+HEADER = ["Summary", "Issue key", "Issue id", "Issue Type", "Status", "Priority", "Labels", "Labels", "Labels",
+          "Description", "Custom field (Story Points)"]
+TYPES = ["Bug", "Task", "Story", "Epic", "Test", "Sub-task"]
+STATES = ["New", "Todo", "In Progress", "Review", "Ready for QA", "Done", "Rejected", "Blocked"]
+LABELS = ["", "", "", "TO_REFINE", "UI", "Backend", "Firmware", "Performance", "Cura", "Documentation"]
+POINTS = ["", "", "1", "2", "3", "5", "8", "0.5"]
+
+
+def write_export(file_name: str, num_rows: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with open(file_name, "w") as export_file:
+        export_file.write(";".join(HEADER) + "\n")
+        for idx in range(num_rows):
+            export_file.write(";".join([
+                f"Summary of issue {idx}", f"PRJ-{idx}", str(10000 + idx), rng.choice(TYPES), rng.choice(STATES),
+                "Medium", rng.choice(LABELS), rng.choice(LABELS), rng.choice(LABELS),
+                f'"Description; with a separator and a\nnewline {idx}"', rng.choice(POINTS)
+            ]) + "\n")
+
+
+def run_engine(engine: str, file_name: str) -> (float, List[str]):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backlog-overview.py")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, script, file_name], env=dict(os.environ, BACKLOG_ENGINE=engine),
+        stdout=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    duration = time.perf_counter() - start
+
+    # Only the findings are compared, the ignored states are listed with all columns by the row engine and with only
+    # the used ones by pandas.
+    lines = result.stdout.splitlines()
+    return duration, lines[lines.index("Labels:"):]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the engines of backlog-overview.py")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of issues in the synthetic export")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs to take the fastest of")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "export.csv")
+        write_export(file_name, args.rows, args.seed)
+        print(f"{args.rows} rows, {os.path.getsize(file_name) / 1e6:.1f} MB")
+
+        findings = {}
+        for engine in ("rows", "pandas"):
+            durations = []
+            for _ in range(args.repeat):
+                duration, findings[engine] = run_engine(engine, file_name)
+                durations.append(duration)
+            print(f"{engine:7} {min(durations):7.2f} s")
+
+    if findings["rows"] != findings["pandas"]:
+        print("The engines report different findings")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
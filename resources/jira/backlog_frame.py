@@ -0,0 +1,158 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional
+import csv
+
+import numpy
+import pandas
+
+if TYPE_CHECKING:
+    from jira.resources import Issue
+
+from backlog_report import CLOSED_STATES, OPEN_STATES, REJECT_TYPES
+
+# Columns of the Jira CSV export that the backlog overview uses, by the names they get in the frame.
+EXPORT_COLUMNS = {"Status": "status", "Issue Type": "type", "Custom field (Story Points)": "points"}
+EXPORT_LABEL_COLUMN = "Labels"
+
+
+class BacklogCounts(NamedTuple):
+    labels: Dict[str, int]
+    types: Dict[str, int]
+    states: Dict[str, int]
+    sp_count: float
+    # The issues with a status that is neither open nor closed, by the row (or issue key) they are on.
+    ignored_states: pandas.Series
+    # The story point values that are not a number, by the row (or issue key) they are on.
+    invalid_points: pandas.Series
+
+
+# Reads only the used columns of the export into a frame with the columns status, type, points and labels_<n>.
+def read_export(file_name: str) -> pandas.DataFrame:
+    with open(file_name, newline="") as export_file:
+        header = next(csv.reader(export_file, delimiter=";"), [])
+
+    names: Dict[int, str] = {}
+    for idx, column_name in enumerate(header):
+        if column_name == EXPORT_LABEL_COLUMN:
+            names[idx] = f"labels_{len(names)}"
+        elif column_name in EXPORT_COLUMNS:
+            names[idx] = EXPORT_COLUMNS[column_name]
+
+    # A backlog has few distinct values per column, so they are read as categories and only the categories have to be
+    # stripped and lowercased, grouped and converted instead of every row.
+    frame = pandas.read_csv(
+        file_name, sep=";", header=0, usecols=list(names), dtype="category", keep_default_na=False
+    )
+    # The columns are in file order, which is the order of the (sorted) header indexes.
+    frame.columns = [names[idx] for idx in sorted(names)]
+    label_idx = {names[idx]: idx for idx in names if names[idx].startswith("labels_")}
+    if label_idx:
+        # The parser pads rows with fewer fields than the header with "", but the row parser skips the label columns
+        # past the end of a row, so those cells are made NaN and not counted.
+        row_lengths = pandas.Series(_row_lengths(file_name), index=frame.index)
+    for column in frame.columns:
+        values = frame[column]
+        if column in label_idx:
+            frame[column] = values.where(row_lengths > label_idx[column]).map(_normalize, na_action="ignore")
+            continue
+        if values.hasnans:  # Rows with fewer fields than the header.
+            if "" not in values.cat.categories:
+                values = values.cat.add_categories([""])
+            values = values.fillna("")
+        frame[column] = values.map(_normalize)
+
+    # Rows without any of the used values are the empty lines the row parser skips.
+    return frame[(frame.fillna("") != "").any(axis=1)]
+
+
+# The number of fields of each row after the header, without blank lines like the parsers skip them. The separators and
+# line ends are counted on the raw bytes, those after an odd number of quotes are in a quoted field ("" in a quoted field
+# adds two quotes).
+def _row_lengths(file_name: str) -> numpy.ndarray:
+    data = numpy.fromfile(file_name, dtype=numpy.uint8)
+    if len(data) == 0 or data[-1] != ord("\n"):
+        data = numpy.append(data, numpy.uint8(ord("\n")))
+    quotes = numpy.flatnonzero(data == ord("\""))
+
+    def outside_quotes(positions: numpy.ndarray) -> numpy.ndarray:
+        return positions[numpy.searchsorted(quotes, positions) % 2 == 0]
+
+    separators = outside_quotes(numpy.flatnonzero(data == ord(";")))
+    line_ends = outside_quotes(numpy.flatnonzero(data == ord("\n")))
+
+    line_starts = numpy.concatenate(([0], line_ends[:-1] + 1))
+    fields = numpy.diff(numpy.searchsorted(separators, numpy.concatenate(([0], line_ends)))) + 1
+    line_lengths = line_ends - line_starts
+    is_blank = (line_lengths == 0) | ((line_lengths == 1) & (data[line_starts] == ord("\r")))
+    return fields[1:][~is_blank[1:]]
+
+
+def _normalize(value: str) -> str:
+    return value.strip().lower()
+
+
+def _parse_points(value) -> float:
+    if pandas.isna(value):  # Issues without story points in a frame of fetched issues.
+        return 0.0
+    try:
+        return float(value or "0")
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+# Builds the frame of the fetched issues, with the issue keys as index and the labels as a list per issue.
+def issues_frame(issues: Iterable["Issue"]) -> pandas.DataFrame:
+    keys: List[str] = []
+    columns: Dict[str, list] = {"status": [], "type": [], "points": [], "labels": []}
+    for issue in issues:
+        keys.append(issue.key)
+        columns["status"].append(issue.fields.status.name)
+        columns["type"].append(issue.fields.issuetype.name)
+        columns["points"].append(issue.fields.customfield_10028)
+        columns["labels"].append(issue.fields.labels)
+
+    # Object columns, as without issues the empty columns would otherwise be float columns without the .str accessor.
+    frame = pandas.DataFrame(columns, index=pandas.Index(keys, dtype=object), dtype=object)
+    frame["status"] = frame["status"].str.lower()
+    frame["type"] = frame["type"].str.lower()
+    return frame
+
+
+# Counts the same as the row by row loops of the backlog scripts, in the order they first encounter each value.
+def count_backlog(frame: pandas.DataFrame) -> BacklogCounts:
+    states = frame["status"].groupby(frame["status"], sort=False, observed=True).size()
+
+    is_open = frame["status"].isin(OPEN_STATES)
+    ignored_states = frame["status"][~is_open & ~frame["status"].isin(CLOSED_STATES)]
+
+    types_column: Optional[pandas.Series] = frame["type"][is_open] if "type" in frame else None
+    accepted = is_open
+    types = pandas.Series(dtype=int)
+    if types_column is not None:
+        types_column = types_column[~types_column.isin(REJECT_TYPES)]
+        types = types_column.groupby(types_column, sort=False, observed=True).size()
+        accepted = is_open & ~frame["type"].isin(REJECT_TYPES)
+
+    # One label per row, row by row, so the first encountered order is the same as in the loops.
+    if "labels" in frame:
+        labels = frame["labels"][accepted].explode().dropna().str.lower()
+    else:
+        label_columns = [column for column in frame.columns if column.startswith("labels_")]
+        labels = frame[accepted][label_columns].stack()
+    label_counts = labels.groupby(labels, sort=False, observed=True).size()
+
+    sp_count = 0.0
+    invalid_points = pandas.Series(dtype=object)
+    if "points" in frame:
+        raw_points = frame["points"][accepted]
+        points = raw_points.map(_parse_points).astype(float)
+        invalid_points = raw_points[points.isna()]
+        sp_count = float(points.sum())
+
+    return BacklogCounts(
+        {str(name): int(count) for name, count in label_counts.items()},
+        {str(name): int(count) for name, count in types.items()},
+        {str(name): int(count) for name, count in states.items()},
+        sp_count,
+        ignored_states,
+        invalid_points
+    )
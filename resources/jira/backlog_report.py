@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional
+import csv
+
+# jira is only imported when the report is fetched from Jira, see README.md.
+if TYPE_CHECKING:
+    from jira.resources import Issue
+    from jira.client import ResultList
+
+    from issue_store import IssueStore
+
+# The backlog overview of a project, as counted from the Jira API (JiraReport) or from a CSV export (ExportReport).
+# The scripts backlog-overview_api.py and backlog-overview.py print it, other tools can import this module and call
+# report_from_jira() or report_from_export() to get the same numbers without starting a script.
+
+OPEN_STATES = ("new", "todo", "in progress", "review", "ready for qa")
+CLOSED_STATES = ("done", "rejected")
+REJECT_TYPES = ("test", "epic")
+
+
+class BacklogReport(NamedTuple):
+    # Number of open issues per label, type and the number of all issues per status.
+    labels: Dict[str, int]
+    types: Dict[str, int]
+    states: Dict[str, int]
+    to_refine: int
+    story_points: float
+
+    @classmethod
+    def create(cls, labels: Dict[str, int], types: Dict[str, int], states: Dict[str, int], story_points: float) -> "BacklogReport":
+        return cls(dict(labels), dict(types), dict(states), labels.get("to_refine", 0), story_points)
+
+    # The counts of several reports added up, e.g. of all projects in a portfolio.
+    @classmethod
+    def combine(cls, reports: Iterable["BacklogReport"]) -> "BacklogReport":
+        labels: Dict[str, int] = defaultdict(int)
+        types: Dict[str, int] = defaultdict(int)
+        states: Dict[str, int] = defaultdict(int)
+        story_points = 0.0
+        for report in reports:
+            for counts, report_counts in ((labels, report.labels), (types, report.types), (states, report.states)):
+                for name, count in report_counts.items():
+                    counts[name] += count
+            story_points += report.story_points
+        return cls.create(labels, types, states, story_points)
+
+    def to_json(self) -> Dict[str, object]:
+        return {
+            "labels": self.labels,
+            "types": self.types,
+            "states": self.states,
+            "total_types": sum(self.types.values()),
+            "to_refine": self.to_refine,
+            "story_points": self.story_points
+        }
+
+
+class JiraReport():
+
+    # Jira lowers maxResults to the largest page size it allows, the pages are then stepped by the size it returned.
+    PAGE_SIZE = 1000
+    # Only the fields that the report uses, so Jira does not send descriptions, comments and the like.
+    FIELDS = ["issuetype", "status", "labels", "customfield_10028"]
+
+    def __init__(self, api_key: str, api_usr: str, project_id: str, server: str = "https://ultimaker.atlassian.net/", max_concurrent_requests: int = 8,
+                 store: Optional[IssueStore] = None, offline: bool = False, engine: str = "rows") -> None:
+        self._num_issues = 0
+        self._total = 1
+        self._max_concurrent_requests = max(1, max_concurrent_requests)
+
+        self._labels: Dict[str, int] = defaultdict(int)
+        self._sp_count = 0.0
+
+        self._types: Dict[str, int] = defaultdict(int)
+        self._states: Dict[str, int] = defaultdict(int)
+
+        self._project_id = project_id
+        self._store = store
+        self._offline = offline
+        self._engine = engine
+        self._jira = None
+        if not offline:
+            # Rate limited and failed requests are retried by the shared client.
+            from jira_client import get_client
+
+            self._jira = get_client(server, api_usr, api_key, self._max_concurrent_requests).jira
+
+
+    def _grab_page(self, jql: str, start_at: int, max_results: int, fields: List[str]) -> ResultList[Issue]:
+        # The issues are ordered by key, so the pages stay consistent while they are fetched at the same time.
+        print(f"Grabbing from {start_at} ({self._total})")
+        return self._jira.search_issues(
+            f'{jql} ORDER BY key',
+            startAt=start_at,
+            maxResults=max_results,
+            fields=fields
+        )
+
+    def _grab_issues(self, jql: str, fields: Optional[List[str]] = None) -> Iterator[ResultList[Issue]]:
+        # Each page is counted while the next pages are still being fetched concurrently, see paginate().
+        from jira_client import paginate
+
+        fields = fields or self.FIELDS
+        self._num_issues = 0
+        pages = paginate(lambda start_at, max_results: self._grab_page(jql, start_at, max_results, fields), self.PAGE_SIZE, self._max_concurrent_requests)
+        for page in pages:
+            self._num_issues += len(page)
+            self._total = page.total
+            yield page
+
+    def _is_reject_type(self, issue: Issue) -> bool:
+        issue_type = issue.fields.issuetype.name.lower()
+
+        if issue_type in REJECT_TYPES:
+            return True
+
+        self._types[issue_type] += 1
+
+        return False
+
+    def _is_reject_status(self, issue: Issue) -> bool:
+        status = issue.fields.status.name.lower()  # line_elts[status_idx]
+        self._states[status] += 1
+
+        if status not in OPEN_STATES:
+
+            if status not in CLOSED_STATES:
+                print(f"Ignored status [{status}] > {issue.key}")
+
+            return True
+
+        return False
+
+    def _count_points_2(self, issue: Issue) -> None:
+        self._sp_count += float(issue.fields.customfield_10028 or "0")
+
+    def _count_labels_2(self, issue: Issue) -> None:
+        for label in issue.fields.labels:
+            label = label.lower()
+            self._labels[label] += 1
+
+    def _get_issues(self) -> Iterator[Issue]:
+        jql = f"project = {self._project_id}"
+        if self._store is None:
+            # Each page is counted while the next pages are still being fetched, and dropped once it has been counted.
+            for page in self._grab_issues(jql):
+                yield from page
+            return
+
+        # The store can be synced and read by the reports of several projects at the same time, see IssueStore.
+        if self._offline:
+            # Without a sync the report would count no issues, as if the project were empty.
+            if self._store.get_last_sync(jql) is None:
+                raise LookupError(f"'{jql}' is not in the local copy, run once without JIRA_OFFLINE to sync it")
+        else:
+            self._store.sync(jql, self.FIELDS, lambda sync_jql, fields: (issue for page in self._grab_issues(sync_jql, fields) for issue in page))
+        yield from self._store.get_issues(jql)
+
+    def _count_frame(self) -> None:
+        # Counts whole columns at once, see backlog_frame.py.
+        import backlog_frame
+
+        counts = backlog_frame.count_backlog(backlog_frame.issues_frame(self._get_issues()))
+        for key, status in counts.ignored_states.items():
+            print(f"Ignored status [{status}] > {key}")
+        if not counts.invalid_points.empty:
+            raise ValueError(f"could not convert story points to float: {dict(counts.invalid_points)}")
+
+        self._labels.update(counts.labels)
+        self._types.update(counts.types)
+        self._states.update(counts.states)
+        self._sp_count = counts.sp_count
+
+    def create(self) -> BacklogReport:
+        if self._engine == "pandas":
+            self._count_frame()
+            return BacklogReport.create(self._labels, self._types, self._states, self._sp_count)
+
+        for issue in self._get_issues():
+
+            if self._is_reject_status(issue) or self._is_reject_type(issue):
+                continue
+
+            self._count_labels_2(issue)
+            self._count_points_2(issue)
+
+        return BacklogReport.create(self._labels, self._types, self._states, self._sp_count)
+
+
+class ExportReport():
+
+    LABEL_COLUMN = "Labels"
+    POINTS_COLUMN = "Custom field (Story Points)"
+    STATUS_COLUMN = "Status"
+    TYPE_COLUMN = "Issue Type"
+
+    def __init__(self, file_name: str, engine: str = "rows") -> None:
+        self._file_name = file_name
+        self._engine = engine
+
+        self._label_idx: List[int] = []
+        self._sp_idx: Optional[int] = None
+        self._status_idx: Optional[int] = None
+        self._type_idx: Optional[int] = None
+
+        self._labels: Dict[str, int] = defaultdict(int)
+        self._sp_count = 0.0
+
+        self._types: Dict[str, int] = defaultdict(int)
+        self._states: Dict[str, int] = defaultdict(int)
+
+    def _is_reject_status(self, line: str, line_elts: List[str]) -> bool:
+        status = line_elts[self._status_idx]
+        self._states[status] += 1
+
+        if status not in OPEN_STATES:
+
+            if status not in CLOSED_STATES:
+                print(f"Ignored status [{status}] > {line}")
+
+            return True
+
+        return False
+
+    def _is_reject_type(self, line_elts: List[str]) -> bool:
+        if self._type_idx is not None:
+            ticket_type = line_elts[self._type_idx]
+
+            if ticket_type in REJECT_TYPES:
+                return True
+
+            self._types[ticket_type] += 1
+
+        return False
+
+    def _count_labels(self, line_elts: List[str]) -> None:
+        for idx in self._label_idx:
+            if idx < len(line_elts):
+                self._labels[line_elts[idx]] += 1
+
+    def _count_points(self, line_elts: List[str]) -> None:
+        if self._sp_idx is not None:
+            try:
+                self._sp_count += float(line_elts[self._sp_idx] or "0")
+            except Exception as ex:
+                print("Fork:", repr(ex), " >> ", line_elts)
+
+    def _count_rows(self) -> None:
+        # The export is read row by row, so quoted fields with semicolons or newlines are handled and only one row is
+        # in memory.
+        with open(self._file_name, newline="") as export_file:
+            rows = csv.reader(export_file, delimiter=";")
+
+            for idx, column_name in enumerate(next(rows, [])):
+                if column_name == self.LABEL_COLUMN:
+                    self._label_idx.append(idx)
+                if column_name == self.POINTS_COLUMN:
+                    self._sp_idx = idx
+                if column_name == self.STATUS_COLUMN:
+                    self._status_idx = idx
+                if column_name == self.TYPE_COLUMN:
+                    self._type_idx = idx
+
+            for row in rows:
+                line_split = [value.strip().lower() for value in row]
+
+                if not any(line_split):
+                    continue
+
+                if self._is_reject_status(";".join(row), line_split) or self._is_reject_type(line_split):
+                    continue
+
+                self._count_labels(line_split)
+                self._count_points(line_split)
+
+    def _count_frame(self) -> None:
+        # Counts whole columns at once, see backlog_frame.py. Only the used columns are read from the export.
+        import backlog_frame
+
+        export_frame = backlog_frame.read_export(self._file_name)
+        counts = backlog_frame.count_backlog(export_frame)
+
+        ignored_rows = export_frame.loc[counts.ignored_states.index].astype(str)
+        if not ignored_rows.empty:
+            ignored_lines = ignored_rows.iloc[:, 0].str.cat(ignored_rows.iloc[:, 1:], sep=";")
+            print("\n".join(f"Ignored status [{status}] > {line}" for status, line in zip(counts.ignored_states, ignored_lines)))
+        for row_idx, points in counts.invalid_points.items():
+            print("Fork:", repr(ValueError(f"could not convert string to float: {points!r}")), " >> ", list(export_frame.loc[row_idx]))
+
+        self._labels.update(counts.labels)
+        self._types.update(counts.types)
+        self._states.update(counts.states)
+        self._sp_count = counts.sp_count
+
+    def create(self) -> BacklogReport:
+        if self._engine == "pandas":
+            self._count_frame()
+        else:
+            self._count_rows()
+
+        return BacklogReport.create(self._labels, self._types, self._states, self._sp_count)
+
+
+def report_from_jira(api_key: str, api_usr: str, project_id: str, server: str = "https://ultimaker.atlassian.net/", max_concurrent_requests: int = 8,
+                     store: Optional[IssueStore] = None, offline: bool = False, engine: str = "rows") -> BacklogReport:
+    return JiraReport(api_key, api_usr, project_id, server, max_concurrent_requests, store, offline, engine).create()
+
+
+# The reports of several projects, created concurrently with the one shared Jira client. The requests in flight are
+# divided over the projects, so together they make at most max_concurrent_requests requests at a time.
+def reports_from_jira(api_key: str, api_usr: str, project_ids: List[str], server: str = "https://ultimaker.atlassian.net/", max_concurrent_requests: int = 8,
+                      store: Optional[IssueStore] = None, offline: bool = False, engine: str = "rows") -> Dict[str, BacklogReport]:
+    max_concurrent_requests = max(1, max_concurrent_requests)
+    max_concurrent_projects = max(1, min(len(project_ids), max_concurrent_requests))
+    if not offline:
+        from jira_client import get_client
+
+        get_client(server, api_usr, api_key, max_concurrent_requests)
+
+    def create_report(project_id: str) -> BacklogReport:
+        return report_from_jira(api_key, api_usr, project_id, server, max_concurrent_requests // max_concurrent_projects, store, offline, engine)
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_projects) as executor:
+        return dict(zip(project_ids, executor.map(create_report, project_ids)))
+
+
+def report_from_export(file_name: str, engine: str = "rows") -> BacklogReport:
+    return ExportReport(file_name, engine).create()
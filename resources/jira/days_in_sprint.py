@@ -1,45 +1,60 @@
-from collections import defaultdict
-from typing import Dict, List, Tuple, Union
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import cycle, islice
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
 import os
-from datetime import date
+import sys
+from datetime import date, datetime, timedelta, timezone
 
-import pandas
-import matplotlib.pyplot as plt
+from issue_store import IssueStore
+from snapshot_store import SnapshotStore
 
-from jira import JIRA
-from jira.resources import Issue, Sprint, Board
-from jira.client import ResultList
+# pandas, matplotlib and jira take most of the startup time, so they are imported where they are used. Starting the
+# script for --help, and importing it in the processes that render the graphs, does not pay for the ones not needed.
+if TYPE_CHECKING:
+    import pandas
+    from jira.client import ResultList
+    from jira.resources import Issue, Sprint, Board
+    from sprint_flow import FlowMetrics, StatusTimeline
 
 
 class ProgressMonitor:
     PAGE_SIZE = 50
+    # Jira lowers maxResults to the largest page size it allows for issue searches, which is more than for boards and
+    # sprints. Only the fields that are used are requested, so Jira does not send descriptions, comments and the like.
+    ISSUE_PAGE_SIZE = 1000
+    ISSUE_FIELDS = ["status", "summary"]
+    # The changelog of an issue is included in the search results, up to the latest CHANGELOG_PAGE_SIZE histories.
+    FLOW_FIELDS = ["status", "summary", "created"]
+    CHANGELOG_PAGE_SIZE = 100
     DEFAULT_LANE = -1  # See lut: not in sprint
 
     lut = {"not in sprint": -1, "new": 0, "todo": 1, "in progress": 2, "review": 3, "ready for qa": 4, "done": 5}
 
-    def __init__(self, api_key: str, api_usr: str, board_id: int) -> None:
+    def __init__(self, api_key: str, api_usr: str, board_id: int, snapshots: SnapshotStore, store: Optional[IssueStore] = None,
+                 server: str = "https://ultimaker.atlassian.net/") -> None:
         api_key = os.environ.get("JIRA_API_KEY", "")
         api_usr = os.environ.get("JIRA_API_USR", "")
 
-        self._jira = JIRA("https://ultimaker.atlassian.net/", basic_auth=(api_usr, api_key))
+        from jira_client import get_client
+
+        self._client = get_client(server, api_usr, api_key)
+        self._jira = self._client.jira
 
         self.board_id = board_id
+        self._snapshots = snapshots
+        self._store = store
 
     def get_boards(self, project_id: str) -> List[Board]:
-        boards = []
-        total_boards = 1
-        num_boards = 0
-
-        while num_boards < total_boards:
-            all_boards: ResultList[Board] = self._jira.boards(
-                startAt=num_boards, maxResults=self.PAGE_SIZE, projectKeyOrID=project_id
-            )
+        from jira_client import paginate
 
-            for board in all_boards:
-                boards.append(board)
-
-            num_boards += len(all_boards)
-            total_boards = all_boards.total
+        boards = [
+            board
+            for page in paginate(lambda start_at, max_results: self._jira.boards(start_at, max_results, projectKeyOrID=project_id), self.PAGE_SIZE)
+            for board in page
+        ]
 
         print(f"Found '{len(boards)}' boards")
         for board in boards:
@@ -47,20 +62,13 @@ class ProgressMonitor:
 
     def get_sprints(self, board_id: int, state: str) -> List[Sprint]:
         # sprint states:  future, active, closed
-        sprints = []
-        total_sprints = 1
-        num_sprints = 0
-
-        while num_sprints < total_sprints:
-            all_sprints: ResultList[Sprint] = self._jira.sprints(
-                board_id=board_id, startAt=num_sprints, maxResults=self.PAGE_SIZE, state=state
-            )
+        from jira_client import paginate
 
-            for sprint in all_sprints:
-                sprints.append(sprint)
-
-            num_sprints += len(all_sprints)
-            total_sprints = all_sprints.total
+        sprints = [
+            sprint
+            for page in paginate(lambda start_at, max_results: self._jira.sprints(board_id, startAt=start_at, maxResults=max_results, state=state), self.PAGE_SIZE)
+            for sprint in page
+        ]
 
         print(f"Found {len(sprints)} '{state}' sprints:")
         for sprint in sprints:
@@ -68,55 +76,77 @@ class ProgressMonitor:
 
         return sprints
 
-    def _grab_issues(self, jql: str) -> List[Issue]:
-        num_issues = 0
-        total = 1
-        issues = []
+    def _grab_issues(self, jql: str, fields: Optional[List[str]] = None, expand: Optional[str] = None) -> Iterator[Issue]:
+        # The issues are yielded page by page, while the next page is already being fetched in the background.
+        from jira_client import paginate
 
-        while num_issues < total:
-            all_issues: ResultList[Issue] = self._jira.search_issues(
-                jql, startAt=num_issues, maxResults=self.PAGE_SIZE
-            )
+        fields = fields or self.ISSUE_FIELDS
+        pages: Iterator[ResultList[Issue]] = paginate(
+            lambda start_at, max_results: self._jira.search_issues(jql, startAt=start_at, maxResults=max_results, fields=fields, expand=expand),
+            self.ISSUE_PAGE_SIZE
+        )
+        for page in pages:
+            yield from page
 
-            for issue in all_issues:
-                issues.append(issue)
+    def get_issues_for_sprint(self, sprint_id: int) -> Iterator[Issue]:
+        jql = f"Sprint={sprint_id}"
+        if self._store is None:
+            return self._grab_issues(jql)
 
-            num_issues += len(all_issues)
-            total = all_issues.total
+        # Only the issues updated since the previous run are fetched, the lanes are recorded from the local copy.
+        self._store.sync(jql, self.ISSUE_FIELDS, self._grab_issues)
+        return self._store.get_issues(jql)
 
-        return issues
+    def _grab_histories(self, issue: Issue) -> List[dict]:
+        changelog = issue.raw["changelog"]
+        histories = list(changelog["histories"])
 
-    def get_issues_for_sprint(self, sprint_id: int) -> List[Issue]:
-        return self._grab_issues(f"Sprint={sprint_id}")
+        # Issues with more changes than the search includes get all histories page by page.
+        if changelog["total"] > len(histories):
+            from jira.client import ResultList
+            from jira_client import paginate
 
-    def read_dataframe(self, sprint_id: int) -> pandas.DataFrame:
-        file_name = f"{sprint_id}_monitor.csv"
+            def fetch(start_at: int, max_results: int) -> ResultList[dict]:
+                page = self._jira._get_json(f"issue/{issue.key}/changelog", params={"startAt": start_at, "maxResults": max_results})
+                return ResultList(page["values"], start_at, max_results, page["total"])
 
-        if os.path.exists(file_name):
-            return pandas.read_csv(file_name, index_col=0, header=0).fillna(self.DEFAULT_LANE)
+            histories = [history for page in paginate(fetch, self.CHANGELOG_PAGE_SIZE) for history in page]
 
-        return pandas.DataFrame(columns=["date"]).fillna(self.DEFAULT_LANE)
+        return histories
 
-    def write_dataframe(self, sprint_id: int, data_frame: pandas.DataFrame) -> None:
+    def get_status_timelines(self, sprint_id: int) -> Iterator[StatusTimeline]:
+        # One search with the changelogs expanded, instead of a request per issue.
+        from sprint_flow import get_status_timeline
+
+        for issue in self._grab_issues(f"Sprint={sprint_id}", self.FLOW_FIELDS, "changelog"):
+            yield get_status_timeline(issue, self._grab_histories(issue))
+
+    def read_dataframe(self, sprint_id: int) -> pandas.DataFrame:
+        return self._snapshots.read_dataframe(sprint_id, self.DEFAULT_LANE)
+
+    def write_snapshot(self, sprint_id: int, day: str, lanes: Dict[str, int]) -> None:
+        # Sprints that were monitored before the snapshot store still have their snapshots in a CSV file.
         file_name = f"{sprint_id}_monitor.csv"
-        data_frame.to_csv(file_name)
-        os.sync()
+        if os.path.exists(file_name) and not self._snapshots.has_sprint(sprint_id):
+            print(f"Importing snapshots from '{file_name}'")
+            self._snapshots.import_csv(sprint_id, file_name)
+
+        self._snapshots.append(sprint_id, day, lanes)
 
-    def get_issues_for_project(self, project_id: int) -> List[Issue]:
+    def get_issues_for_project(self, project_id: int) -> Iterator[Issue]:
         jql = f"project = {project_id} AND type not in (Test)"
         return self._grab_issues(jql)
 
-    def monitor_days_in_sprint(self, sprint: Sprint) -> pandas.DataFrame:
+    def monitor_days_in_sprint(self, sprint: Sprint, issues: Optional[Iterable[Issue]] = None) -> pandas.DataFrame:
         print(f"Monitoring days in sprint: ({sprint.id}) '{sprint.name}'")
-        issues = self.get_issues_for_sprint(sprint.id)
-
-        data_frame = self.read_dataframe(sprint.id)
+        if issues is None:
+            issues = self.get_issues_for_sprint(sprint.id)
 
         today = str(date.today())
-        row: Dict[str, Union[str, int]] = {"date": today}
+        lanes: Dict[str, int] = {}
         print(f"({today}) Tickets in sprint:")
 
-        for issue in issues[1:]:
+        for issue in islice(issues, 1, None):
             print(f"\t({issue.key}) '{issue.fields.summary}'")
 
             status = self.lut.get(issue.fields.status.name.lower(), -1)
@@ -124,11 +154,10 @@ class ProgressMonitor:
             if status == -1:
                 print(f"Unknown state '{issue.fields.status.name}'")
 
-            row[issue.key] = status
+            lanes[issue.key] = status
 
-        data_frame = data_frame.append(row, ignore_index=True).fillna(self.DEFAULT_LANE)
-        self.write_dataframe(sprint.id, data_frame)
-        return data_frame
+        self.write_snapshot(sprint.id, today, lanes)
+        return self.read_dataframe(sprint.id)
 
     def monitor_days_in_active_sprints(self, board_id: int) -> Tuple[pandas.DataFrame, Sprint]:
         sprints = self.get_sprints(board_id, "active")
@@ -136,67 +165,206 @@ class ProgressMonitor:
         for sprint in sprints:
             return (self.monitor_days_in_sprint(sprint), sprint)
 
-    def graph_days_in_sprint(self, data_frame: pandas.DataFrame) -> None:
-        ax = data_frame.plot(marker="o")
-        ax.get_legend().remove()
-
-        y_values = list(self.lut.keys())
-        y_labels = list(self.lut.values())
-
-        x_values = list(data_frame["date"])
-        x_labels = range(0, len(list(data_frame["date"])))
-
-        # self._annotate_with_ticket_ids(ax, data_frame, x_labels)
-        self._annotate_with_ticket_count(ax, data_frame, x_labels)
-
-        plt.yticks(y_labels, y_values)
-        plt.xticks(x_labels, x_values, rotation=45)
-
-    def _annotate_with_ticket_count(self, ax, data_frame, x_labels) -> None:
-        df_ticket_count = df.drop("date", 1).apply(pandas.Series.value_counts, axis=1).fillna(0)
-        columns = data_frame.columns.values[1:]
+    def _get_active_sprints(self, executor: ThreadPoolExecutor, board_ids: List[int]) -> List[Sprint]:
+        sprints: Dict[int, Sprint] = {}
+        for board_sprints in executor.map(lambda board_id: self.get_sprints(board_id, "active"), board_ids):
+            for sprint in board_sprints:
+                sprints.setdefault(sprint.id, sprint)  # A sprint can be on more than one board.
+        return list(sprints.values())
+
+    def monitor_days_in_active_sprints_of_boards(self, board_ids: List[int], max_concurrent_requests: int = 8) -> List[Tuple[pandas.DataFrame, Sprint]]:
+        # The sprints and their issues are fetched concurrently with the one (authenticated) Jira session. The
+        # snapshots are recorded afterwards, one sprint after the other in board order, so the output stays readable.
+        self._client.ensure_connections(max_concurrent_requests)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_requests)) as executor:
+            issues = [
+                (sprint, executor.submit(lambda sprint_id: list(self.get_issues_for_sprint(sprint_id)), sprint.id))
+                for sprint in self._get_active_sprints(executor, board_ids)
+            ]
+            return [(self.monitor_days_in_sprint(sprint, future.result()), sprint) for sprint, future in issues]
+
+    def monitor_flow_in_sprint(self, sprint: Sprint, timelines: Optional[Iterable[StatusTimeline]] = None) -> FlowMetrics:
+        import pandas
+        from sprint_flow import compute_flow, parse_time
+
+        print(f"Flow in sprint: ({sprint.id}) '{sprint.name}'")
+        if timelines is None:
+            timelines = self.get_status_timelines(sprint.id)
+
+        # Up to now for an active sprint, or the end of a closed one.
+        start = parse_time(sprint.startDate)
+        end = min(parse_time(sprint.endDate), datetime.now(timezone.utc))
+        flow = compute_flow(timelines, start, end, self.lut, self.DEFAULT_LANE)
+
+        print("Cycle time (days):")
+        for key, cycle_time in flow.cycle_times.items():
+            print(f"\t({key}) {cycle_time / timedelta(days=1):.1f}")
+        if flow.cycle_times:
+            cycle_days = pandas.Series([cycle_time / timedelta(days=1) for cycle_time in flow.cycle_times.values()])
+            print(f"\tMEAN {cycle_days.mean():.1f}, MEDIAN {cycle_days.median():.1f}")
+
+        print("Time in lane (days, all tickets):")
+        time_in_lane: Dict[str, timedelta] = {}
+        for durations in flow.time_in_status.values():
+            for status, duration in durations.items():
+                time_in_lane[status] = time_in_lane.get(status, timedelta(0)) + duration
+        for status, duration in time_in_lane.items():
+            print(f"\t{status}: {duration / timedelta(days=1):.1f}")
+
+        print("Work in progress:")
+        for day, wip in flow.wip_per_day.items():
+            print(f"\t{day}: {wip}")
+
+        return flow
+
+    def monitor_flow_in_active_sprints_of_boards(self, board_ids: List[int], max_concurrent_requests: int = 8) -> List[Tuple[FlowMetrics, Sprint]]:
+        self._client.ensure_connections(max_concurrent_requests)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_requests)) as executor:
+            timelines = [
+                (sprint, executor.submit(lambda sprint_id: list(self.get_status_timelines(sprint_id)), sprint.id))
+                for sprint in self._get_active_sprints(executor, board_ids)
+            ]
+            return [(self.monitor_flow_in_sprint(sprint, future.result()), sprint) for sprint, future in timelines]
+
+    @classmethod
+    def _draw_days_in_sprint(cls, ax, data_frame: pandas.DataFrame) -> None:
+        import matplotlib
+        import numpy
+        from matplotlib.collections import LineCollection
+        from matplotlib.colors import to_rgba_array
+
+        lanes = data_frame.drop(columns="date")
+        x_labels = numpy.arange(len(data_frame))
+
+        # All tickets are drawn with one artist for the lines and one for the markers, instead of a line per ticket.
+        y = lanes.to_numpy(dtype=float).T
+        colors = to_rgba_array([prop["color"] for prop, _ in zip(cycle(matplotlib.rcParams["axes.prop_cycle"]), lanes.columns)])
+        segments = numpy.stack((numpy.broadcast_to(x_labels, y.shape), y), axis=-1)
+        ax.add_collection(LineCollection(segments, colors=colors))
+        ax.scatter(numpy.tile(x_labels, len(colors)), y.ravel(), c=numpy.repeat(colors, len(x_labels), axis=0), s=36, zorder=2)
+        ax.autoscale_view()
+
+        # cls._annotate_with_ticket_ids(ax, lanes)
+        cls._annotate_with_ticket_count(ax, lanes)
+
+        ax.set_yticks(list(cls.lut.values()))
+        ax.set_yticklabels(list(cls.lut.keys()))
+        ax.set_xticks(x_labels)
+        ax.set_xticklabels(list(data_frame["date"]), rotation=45)
+
+    @staticmethod
+    def _annotate_with_ticket_count(ax, lanes: pandas.DataFrame) -> None:
+        # The tickets in the same lane on the same day share one annotation with their count.
+        ticket_count = lanes.stack().groupby(level=0).value_counts()
+
+        for (x, y), count in ticket_count.items():
+            ax.annotate(
+                f"[{count}]",
+                (x, y),
+                textcoords="offset points",
+                xytext=(5, 5),
+            )
 
-        for x in x_labels:
-            for col in columns:
-                y = data_frame[col][x]
+    @staticmethod
+    def _annotate_with_ticket_ids(ax, lanes: pandas.DataFrame) -> None:
+        # The ids of the tickets in the same lane on the same day are stacked in one annotation, the first at the bottom.
+        stacked = lanes.stack()
+
+        for (x, y), tickets in stacked.groupby([stacked.index.get_level_values(0), stacked.values]):
+            ax.annotate(
+                "\n".join(key[5:] for key in reversed(tickets.index.get_level_values(1))),
+                (x, y),
+                textcoords="offset points",
+                xytext=(10, 10),
+                verticalalignment="bottom",
+                linespacing=1.0,
+            )
 
-                ax.annotate(
-                    f"[{int(df_ticket_count[y][x])}]",
-                    (x, y),
-                    textcoords="offset points",
-                    xytext=(5, 5),
-                )
+    def graph_days_in_sprint(self, data_frame: pandas.DataFrame) -> None:
+        # pyplot (and with it the interactive backend) is only needed to show the graph.
+        import matplotlib.pyplot as plt
 
-    def _annotate_with_ticket_ids(self, ax, data_frame, x_labels) -> None:
-        columns = data_frame.columns.values[1:]
+        self._draw_days_in_sprint(plt.figure().gca(), data_frame)
 
-        for x in x_labels:
-            label_jump: Dict[int, int] = defaultdict(lambda: 1)
-            for col in columns:
-                y = data_frame[col][x]
+    @classmethod
+    def render_graph(cls, data_frame: pandas.DataFrame, file_name: str) -> None:
+        # Renders without pyplot on the non-interactive Agg canvas, so it also works without a display.
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
 
-                ax.annotate(
-                    col[5:],
-                    (x, y),
-                    textcoords="offset points",
-                    xytext=(10, 10 * label_jump[y]),
-                )
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        cls._draw_days_in_sprint(figure.add_subplot(1, 1, 1), data_frame)
+        figure.savefig(file_name, dpi=300)
 
-                label_jump[y] += 1
+    def export_graphs(self, graphs: List[Tuple[pandas.DataFrame, str]], max_workers: Optional[int] = None) -> None:
+        # Rendering is CPU bound, so the graphs are rendered in separate processes.
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.render_graph, data_frame, f"{file_id}.png") for data_frame, file_id in graphs]
+            for future in futures:
+                future.result()
 
     def show_graph(self) -> None:
+        import matplotlib.pyplot as plt
+
         plt.show()
 
-    def export_graph(self, file_id: str) -> None:
-        plt.savefig(f"{file_id}.png", dpi=300)
+    def export_graph(self, data_frame: pandas.DataFrame, file_id: str) -> None:
+        # A single graph is rendered in this process, without pyplot, like those of export_graphs().
+        self.render_graph(data_frame, f"{file_id}.png")
 
 
 # ---
-api_key = os.environ.get("JIRA_API_KEY", "")
-api_usr = os.environ.get("JIRA_API_USR", "")
-board_id = int(os.environ.get("JIRA_BOARD_ID", 0))
-pm = ProgressMonitor(api_key, api_usr, board_id)
-df, s = pm.monitor_days_in_active_sprints(pm.board_id)
-pm.graph_days_in_sprint(df)
-pm.export_graph(f"days_in_{s.id}")
-pm.show_graph()
+ENVIRONMENT_HELP = """environment variables:
+  JIRA_API_KEY, JIRA_API_USR    credentials, see README.md
+  JIRA_BOARD_ID                 board id, or a comma separated list of board ids
+  JIRA_SERVER                   Jira server (default https://ultimaker.atlassian.net/)
+  JIRA_CACHE_FILE               local SQLite copy of the issues, only updated issues are fetched
+  JIRA_SNAPSHOT_FILE            SQLite file with the snapshots (default days_in_sprint.sqlite)
+  JIRA_MAX_CONCURRENT_REQUESTS  requests in flight for several boards (default 8)
+  JIRA_SHOW_GRAPH=0             only export the graphs, without opening a window
+  JIRA_FLOW=1                   reconstruct the lanes from the changelogs instead of recording them
+  JIRA_METRICS_FILE             write the request metrics as JSON to this file"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Record the lane of every ticket of the active sprints and graph the days in sprint",
+        epilog=ENVIRONMENT_HELP, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.parse_args()
+
+    from jira_client import report_metrics
+
+    api_key = os.environ.get("JIRA_API_KEY", "")
+    api_usr = os.environ.get("JIRA_API_USR", "")
+    board_ids = [int(board_id) for board_id in os.environ.get("JIRA_BOARD_ID", "0").split(",")]
+    cache_file = os.environ.get("JIRA_CACHE_FILE", "")
+    snapshot_file = os.environ.get("JIRA_SNAPSHOT_FILE", "days_in_sprint.sqlite")
+    max_concurrent_requests = int(os.environ.get("JIRA_MAX_CONCURRENT_REQUESTS", 8))
+    server = os.environ.get("JIRA_SERVER", "https://ultimaker.atlassian.net/")
+    pm = ProgressMonitor(api_key, api_usr, board_ids[0], SnapshotStore(snapshot_file), IssueStore(cache_file) if cache_file else None, server)
+    show_graph = os.environ.get("JIRA_SHOW_GRAPH", "1") == "1"
+    if os.environ.get("JIRA_FLOW", "") == "1":
+        # The lanes per day are reconstructed from the changelogs of the issues, nothing is recorded.
+        graphs = [
+            (flow.lanes_per_day, s)
+            for flow, s in pm.monitor_flow_in_active_sprints_of_boards(board_ids, max_concurrent_requests)
+        ]
+    elif len(board_ids) == 1:
+        graphs = [pm.monitor_days_in_active_sprints(pm.board_id)]
+    else:
+        # All active sprints of all boards, each in its own graph.
+        graphs = pm.monitor_days_in_active_sprints_of_boards(board_ids, max_concurrent_requests)
+
+    pm.export_graphs([(df, f"days_in_{s.id}") for df, s in graphs])
+    report_metrics(os.environ.get("JIRA_METRICS_FILE", ""))
+    if show_graph:
+        for df, s in graphs:
+            pm.graph_days_in_sprint(df)
+        pm.show_graph()
+    return 0
+
+
+if __name__ == "__main__":  # The processes that render the graphs import this module too.
+    sys.exit(main())
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional
+import json
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+if TYPE_CHECKING:
+    from jira.resources import Issue
+
+
+# Local SQLite store of issue snapshots per JQL query, synced with only the issues updated since the last sync.
+# Issues that are deleted or no longer match the query are not returned by a delta sync, so a delta sync also fetches
+# the keys that match the query and drops the other stored issues. Every FULL_SYNC_INTERVAL seconds the query is
+# fetched completely instead, replacing the stored issues.
+# Each thread has its own connection to the database file, which is in WAL mode, so reports of several projects read
+# and sync at the same time. The issues of a sync are fetched before its write transaction, which is kept short.
+class IssueStore:
+
+    FULL_SYNC_INTERVAL = 7 * 24 * 60 * 60
+    # Extra minutes to look back on a delta sync, for clock differences and issues updated during the previous sync.
+    SYNC_MARGIN_MINUTES = 5
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS issues (
+                query TEXT NOT NULL,
+                key TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                raw TEXT NOT NULL,
+                PRIMARY KEY (query, key)
+            );
+            CREATE TABLE IF NOT EXISTS syncs (
+                query TEXT PRIMARY KEY,
+                fields TEXT NOT NULL,
+                last_sync REAL NOT NULL,
+                last_full_sync REAL NOT NULL
+            );
+        """)
+
+    # The connection of the current thread, which close() closes from another thread.
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=60, check_same_thread=False)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    # Update the stored issues of the query with grab_issues, which fetches the given fields of the issues of a JQL query
+    # from Jira.
+    def sync(self, jql: str, fields: List[str], grab_issues: Callable[[str, List[str]], Iterable[Issue]], full: bool = False) -> None:
+        now = time.time()
+        fields_key = ",".join(sorted(fields))
+        row = self._connection.execute("SELECT fields, last_sync, last_full_sync FROM syncs WHERE query = ?", (jql,)).fetchone()
+
+        full = full or row is None or row[0] != fields_key or now - row[2] > self.FULL_SYNC_INTERVAL
+        if full:
+            print(f"Full sync of '{jql}'")
+            sync_jql = jql
+            last_full_sync = now
+        else:
+            # A relative date is used, as absolute dates in JQL are in the time zone of the Jira user.
+            minutes = int((now - row[1]) / 60) + 1 + self.SYNC_MARGIN_MINUTES
+            print(f"Syncing '{jql}' updated in the last {minutes} minutes")
+            sync_jql = f'({jql}) AND updated >= "-{minutes}m"'
+            last_full_sync = row[2]
+
+        # Issues that no longer match the query (e.g. moved out of a sprint) are not in a delta sync, so the stored issues
+        # are pruned to the keys that match it now, which only need the key of each issue.
+        keys = None if full else {issue.key for issue in grab_issues(jql, ["key"])}
+        # Only the serialized issues are kept until they are written, not the jira Issue objects.
+        rows = [(jql, issue.key, self._get_number(issue.key), json.dumps(issue.raw)) for issue in grab_issues(sync_jql, fields)]
+
+        with self._connection:
+            if keys is None:
+                self._connection.execute("DELETE FROM issues WHERE query = ?", (jql,))
+            else:
+                stored_keys = [key for (key,) in self._connection.execute("SELECT key FROM issues WHERE query = ?", (jql,))]
+                removed_keys = [key for key in stored_keys if key not in keys]
+                self._connection.executemany("DELETE FROM issues WHERE query = ? AND key = ?", ((jql, key) for key in removed_keys))
+                if removed_keys:
+                    print(f"Removed {len(removed_keys)} issues that no longer match")
+            self._connection.executemany("INSERT OR REPLACE INTO issues (query, key, number, raw) VALUES (?, ?, ?, ?)", rows)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO syncs (query, fields, last_sync, last_full_sync) VALUES (?, ?, ?, ?)",
+                (jql, fields_key, now, last_full_sync)
+            )
+        print(f"Synced {len(rows)} issues")
+
+    # The stored issues of the query, ordered by key like the reports request them from Jira. The fields are read like
+    # those of a jira Issue (issue.key, issue.fields.status.name), without importing jira, so offline runs start fast.
+    def get_issues(self, jql: str) -> Iterator[Issue]:
+        cursor = self._connection.execute("SELECT raw FROM issues WHERE query = ? ORDER BY number", (jql,))
+        for (raw,) in cursor:
+            yield json.loads(raw, object_hook=lambda values: SimpleNamespace(**values))
+
+    def get_last_sync(self, jql: str) -> Optional[float]:
+        row = self._connection.execute("SELECT last_sync FROM syncs WHERE query = ?", (jql,)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def _get_number(key: str) -> int:
+        try:
+            return int(key.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return 0
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestConnectionError, Timeout
+
+if TYPE_CHECKING:
+    from jira.client import ResultList
+
+# The Jira client shared by the reports and monitors of a run (get_client()): one authenticated session per server and
+# user, with pooled keep-alive connections, backoff on rate limiting and counters per endpoint (report_metrics()).
+# paginate() pages through any paginated endpoint of that client.
+
+DEFAULT_MAX_CONNECTIONS = 8
+MAX_RETRIES = 3
+RETRY_DELAY = 1.0  # Seconds before the first retry without a Retry-After header, doubled for every next retry.
+MAX_RETRY_DELAY = 60.0
+# Server errors and lost connections are only retried for requests that do not change anything.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+RETRY_STATUS_CODES = (502, 503, 504)
+
+ISSUE_KEY_MATCH = re.compile(r"^[A-Z][A-Z0-9_]*-\d+$")
+
+T = TypeVar("T")
+
+
+class EndpointMetrics:
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_json(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds
+        }
+
+
+# The number of requests, retries, received bytes and the time until the response per endpoint, e.g. "GET search" or
+# "GET board/{id}/sprint". Requests are counted from several threads.
+class RequestMetrics:
+
+    def __init__(self) -> None:
+        self._endpoints: Dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_endpoint(method: str, url: str) -> str:
+        # The path after the API and its version, with the ids and issue keys in it replaced, so they count as one.
+        segments = urlparse(url).path.strip("/").split("/")
+        if segments[:1] == ["rest"]:
+            segments = segments[3:]
+        segments = ["{key}" if ISSUE_KEY_MATCH.match(segment) else "{id}" if segment.isdigit() else segment for segment in segments]
+        return f"{method} {'/'.join(segments)}"
+
+    def record(self, endpoint: str, num_bytes: int, seconds: float) -> None:
+        with self._lock:
+            metrics = self._endpoints.setdefault(endpoint, EndpointMetrics())
+            metrics.calls += 1
+            metrics.bytes += num_bytes
+            metrics.seconds += seconds
+            metrics.max_seconds = max(metrics.max_seconds, seconds)
+
+    def record_retry(self, endpoint: str) -> None:
+        with self._lock:
+            self._endpoints.setdefault(endpoint, EndpointMetrics()).retries += 1
+
+    def to_json(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {endpoint: metrics.to_json() for endpoint, metrics in self._endpoints.items()}
+
+    def log(self, file=sys.stderr) -> None:
+        endpoints = self.to_json()
+        print("Jira requests:", file=file)
+        for endpoint, metrics in sorted(endpoints.items(), key=lambda i: -i[1]["seconds"]):
+            print(
+                f"\t{endpoint}: {metrics['calls']} calls, {metrics['retries']} retries, {metrics['bytes'] / 1e6:.2f} MB, "
+                f"{metrics['seconds'] / max(metrics['calls'], 1):.3f} s avg, {metrics['max_seconds']:.3f} s max",
+                file=file
+            )
+        print(f"\tTOTAL {sum(metrics['calls'] for metrics in endpoints.values())} calls, "
+              f"{sum(metrics['bytes'] for metrics in endpoints.values()) / 1e6:.2f} MB", file=file)
+
+
+# Keeps up to pool_maxsize connections to the server alive for the threads of a run, and retries rate limited
+# requests after the delay the server asks for in Retry-After. Every response is counted in the metrics.
+class RetryingAdapter(HTTPAdapter):
+
+    def __init__(self, metrics: RequestMetrics, pool_maxsize: int, retries: int = MAX_RETRIES) -> None:
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize)
+        self._metrics = metrics
+        self._retries = retries
+
+    @staticmethod
+    def _get_retry_delay(retry_after: Optional[str], attempt: int) -> float:
+        delay = RETRY_DELAY * 2 ** attempt
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(delay, 0.0), MAX_RETRY_DELAY)
+
+    def send(self, request, **kwargs):  # Overrides HTTPAdapter.send
+        endpoint = self._metrics.get_endpoint(request.method, request.url)
+        idempotent = request.method in IDEMPOTENT_METHODS
+
+        for attempt in range(self._retries + 1):
+            start = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except (RequestConnectionError, Timeout) as ex:
+                if not idempotent or attempt == self._retries:
+                    raise
+                delay = self._get_retry_delay(None, attempt)
+                print(f"Retrying {endpoint} in {delay}s after: {ex!r}")
+                self._metrics.record_retry(endpoint)
+                time.sleep(delay)
+                continue
+
+            # The session sets response.elapsed only after the adapter returns, the body is read here.
+            self._metrics.record(endpoint, len(response.content), time.perf_counter() - start)
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUS_CODES)
+            if not retryable or attempt == self._retries:
+                return response
+
+            delay = self._get_retry_delay(response.headers.get("Retry-After"), attempt)
+            print(f"Retrying {endpoint} in {delay}s after: HTTP {response.status_code}")
+            self._metrics.record_retry(endpoint)
+            response.close()
+            time.sleep(delay)
+
+
+class JiraClient:
+
+    def __init__(self, server: str, api_usr: str, api_key: str, max_connections: int = DEFAULT_MAX_CONNECTIONS) -> None:
+        self.metrics = RequestMetrics()
+        self._max_connections = 0
+        from jira import JIRA
+
+        # The session itself does not retry, the adapter does. The server info is requested once the adapter is mounted.
+        self.jira = JIRA(server, basic_auth=(api_usr, api_key), max_retries=0, get_server_info=False)
+        self.ensure_connections(max_connections)
+        self.jira.deploymentType = self.jira.server_info().get("deploymentType")
+
+    # Enlarges the connection pool to the number of concurrent requests a caller makes, so no connection is dropped.
+    def ensure_connections(self, max_connections: int) -> None:
+        if max_connections <= self._max_connections:
+            return
+        self._max_connections = max_connections
+        adapter = RetryingAdapter(self.metrics, max_connections)
+        self.jira._session.mount("https://", adapter)
+        self.jira._session.mount("http://", adapter)
+
+
+_clients: Dict[Tuple[str, str], JiraClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(server: str, api_usr: str, api_key: str, max_connections: int = DEFAULT_MAX_CONNECTIONS) -> JiraClient:
+    with _clients_lock:
+        client = _clients.get((server, api_usr))
+        if client is None:
+            client = _clients[(server, api_usr)] = JiraClient(server, api_usr, api_key, max_connections)
+        client.ensure_connections(max_connections)
+        return client
+
+
+# Prints the request metrics of the clients of this run to stderr, and writes them as JSON to file_name if it is set.
+def report_metrics(file_name: str = "") -> None:
+    with _clients_lock:
+        clients = dict(_clients)
+    for (server, _), client in clients.items():
+        print(server, file=sys.stderr)
+        client.metrics.log()
+
+    if file_name:
+        with open(file_name, "w") as metrics_file:
+            json.dump({server: client.metrics.to_json() for (server, _), client in clients.items()}, metrics_file, indent=4)
+
+
+# Pages through a paginated endpoint, fetch(start_at, max_results) returns one page. The first page tells how many
+# items there are, up to max_concurrent of the next pages are then fetched while the earlier ones are being used. The
+# server may return fewer items than requested, so the pages are stepped by the size of the first page. The pages are
+# yielded in order.
+def paginate(fetch: Callable[[int, int], ResultList[T]], page_size: int, max_concurrent: int = 1) -> Iterator[ResultList[T]]:
+    first_page = fetch(0, page_size)
+    yield first_page
+    if not first_page:
+        return
+
+    start_ats = iter(range(len(first_page), first_page.total, len(first_page)))
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrent)) as executor:
+        # Only as many pages are in flight as there are workers, so pages that finish early do not pile up in memory.
+        pending: Deque[Future] = deque()
+        for start_at in start_ats:
+            pending.append(executor.submit(fetch, start_at, page_size))
+            if len(pending) == max_concurrent:
+                break
+
+        while pending:
+            page = pending.popleft().result()
+            next_start_at = next(start_ats, None)
+            if next_start_at is not None:
+                pending.append(executor.submit(fetch, next_start_at, page_size))
+            yield page
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict
+import sqlite3
+
+if TYPE_CHECKING:
+    import pandas
+
+
+# Append-only SQLite store of the lane every issue of a sprint is in, one row per sprint, day and issue.
+# A run only writes the rows of its own day, instead of rewriting the snapshots of all previous days.
+class SnapshotStore:
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path)
+        # With a write-ahead log a run appends its rows to the log and SQLite syncs only that file on commit.
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                sprint_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                key TEXT NOT NULL,
+                lane INTEGER NOT NULL,
+                PRIMARY KEY (sprint_id, date, key)
+            );
+        """)
+
+    def has_sprint(self, sprint_id: int) -> bool:
+        row = self._connection.execute("SELECT 1 FROM snapshots WHERE sprint_id = ? LIMIT 1", (sprint_id,)).fetchone()
+        return row is not None
+
+    # Records the lanes of the issues on a day. Running again on the same day replaces the lanes of that day.
+    def append(self, sprint_id: int, day: str, lanes: Dict[str, int]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO snapshots (sprint_id, date, key, lane) VALUES (?, ?, ?, ?)",
+                ((sprint_id, day, key, lane) for key, lane in lanes.items())
+            )
+
+    # Imports the snapshots of a sprint from the CSV file that was written before this store, one row per day.
+    def import_csv(self, sprint_id: int, file_name: str) -> None:
+        import pandas
+
+        data_frame = pandas.read_csv(file_name, index_col=0, header=0)
+        for _, row in data_frame.iterrows():
+            lanes = {key: int(lane) for key, lane in row.drop("date").items() if not pandas.isna(lane)}
+            self.append(sprint_id, str(row["date"]), lanes)
+
+    # The snapshots of a sprint in the wide layout of the graphs: a date column and a column per issue, in the order
+    # the issues were first recorded. Issues that were not in the sprint on a day get default_lane.
+    def read_dataframe(self, sprint_id: int, default_lane: int) -> pandas.DataFrame:
+        import pandas
+
+        snapshots = pandas.read_sql_query(
+            "SELECT date, key, lane FROM snapshots WHERE sprint_id = ? ORDER BY date, rowid", self._connection,
+            params=(sprint_id,)
+        )
+        if snapshots.empty:
+            return pandas.DataFrame(columns=["date"])
+
+        data_frame = snapshots.pivot(index="date", columns="key", values="lane")
+        data_frame = data_frame[list(snapshots["key"].drop_duplicates())].fillna(default_lane)
+        data_frame.columns.name = None
+        return data_frame.reset_index()
+
+    def close(self) -> None:
+        self._connection.close()
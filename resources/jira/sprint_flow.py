@@ -0,0 +1,114 @@
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pandas
+
+if TYPE_CHECKING:
+    from jira.resources import Issue
+
+# Flow metrics of a sprint reconstructed from the status changes in the changelog of its issues, so they do not
+# depend on when (or whether) the lanes were sampled.
+
+ACTIVE_STATES = ("in progress", "review", "ready for qa")
+DONE_STATE = "done"
+JIRA_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.strptime(value, JIRA_TIME_FORMAT)
+
+
+class StatusTimeline(NamedTuple):
+    key: str
+    summary: str
+    created: datetime
+    # The (lowercase) statuses of the issue with the time it entered them, the first one when it was created.
+    changes: List[Tuple[datetime, str]]
+
+    def status_at(self, moment: datetime) -> Optional[str]:
+        idx = bisect_right([since for since, _ in self.changes], moment)
+        return self.changes[idx - 1][1] if idx > 0 else None
+
+    # The time spent per status between start and end.
+    def time_in_status(self, start: datetime, end: datetime) -> Dict[str, timedelta]:
+        durations: Dict[str, timedelta] = {}
+        for idx, (since, status) in enumerate(self.changes):
+            until = self.changes[idx + 1][0] if idx + 1 < len(self.changes) else end
+            duration = min(until, end) - max(since, start)
+            if duration > timedelta(0):
+                durations[status] = durations.get(status, timedelta(0)) + duration
+        return durations
+
+    # The time between first starting on the issue and finishing it, None if it is not done (again).
+    def cycle_time(self) -> Optional[timedelta]:
+        started = next((since for since, status in self.changes if status in ACTIVE_STATES), None)
+        since, status = self.changes[-1]
+        if started is None or status != DONE_STATE:
+            return None
+        return since - started
+
+
+# Builds the timeline from an issue fetched with the created and status fields and all of its changelog histories.
+def get_status_timeline(issue: "Issue", histories: Iterable[dict]) -> StatusTimeline:
+    status_changes = [
+        (parse_time(history["created"]), item)
+        for history in histories
+        for item in history["items"]
+        if item["field"] == "status"
+    ]
+    status_changes.sort(key=lambda change: change[0])
+
+    created = parse_time(issue.fields.created)
+    if status_changes:
+        initial_status = (status_changes[0][1]["fromString"] or "").lower()
+    else:
+        initial_status = issue.fields.status.name.lower()
+
+    changes = [(created, initial_status)]
+    changes.extend((since, (item["toString"] or "").lower()) for since, item in status_changes)
+    return StatusTimeline(issue.key, issue.fields.summary, created, changes)
+
+
+class FlowMetrics(NamedTuple):
+    # Per done issue, see StatusTimeline.cycle_time().
+    cycle_times: Dict[str, timedelta]
+    # Per issue, the time it spent in each status during the sprint.
+    time_in_status: Dict[str, Dict[str, timedelta]]
+    # The number of issues in an active status at the end of each day.
+    wip_per_day: Dict[date, int]
+    # The lane per issue at the end of each day, in the layout of the days-in-sprint snapshots.
+    lanes_per_day: pandas.DataFrame
+
+
+def compute_flow(timelines: Iterable[StatusTimeline], start: datetime, end: datetime, lut: Dict[str, int], default_lane: int) -> FlowMetrics:
+    timelines = list(timelines)
+
+    days: List[Tuple[date, datetime]] = []
+    day = start.date()
+    while day <= end.astimezone(start.tzinfo).date():
+        end_of_day = datetime.combine(day + timedelta(days=1), time(), tzinfo=start.tzinfo)
+        days.append((day, min(end_of_day, end)))
+        day += timedelta(days=1)
+
+    lanes: Dict[str, List[int]] = {"date": [str(day) for day, _ in days]}
+    wip_per_day = {day: 0 for day, _ in days}
+    for timeline in timelines:
+        statuses = [timeline.status_at(end_of_day) for _, end_of_day in days]
+        lanes[timeline.key] = [lut.get(status, default_lane) if status is not None else default_lane for status in statuses]
+        for (day, _), status in zip(days, statuses):
+            if status in ACTIVE_STATES:
+                wip_per_day[day] += 1
+
+    cycle_times = {}
+    for timeline in timelines:
+        cycle_time = timeline.cycle_time()
+        if cycle_time is not None:
+            cycle_times[timeline.key] = cycle_time
+
+    return FlowMetrics(
+        cycle_times,
+        {timeline.key: timeline.time_in_status(start, end) for timeline in timelines},
+        wip_per_day,
+        pandas.DataFrame(lanes)
+    )
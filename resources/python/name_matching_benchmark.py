@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Ultimaker B.V.
+# Uranium is released under the terms of the AGPLv3 or higher.
+
+# Micro benchmark of the naming rules of pep8_check_python.py. Collects the identifiers of the given Python files and
+# measures the cost per identifier of matching them with the plain regular expressions and with the cached matches.
+
+import os
+import sys
+import timeit
+import tokenize
+import argparse
+import warnings
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")  # pep8 itself has regular expressions that are deprecated in newer Python versions.
+    import pep8_check_python as checker
+
+RULES = [
+    ("class", checker.CLASS_NAME_MATCH, checker.isClassName),
+    ("function", checker.FUNCTION_NAME_MATCH, checker.isFunctionName),
+    ("member", checker.MEMBER_NAME_MATCH, checker.isMemberName),
+    ("variable", checker.VARIABLE_NAME_MATCH, checker.isVariableName),
+]
+
+
+def collectNames(paths):
+    names = []
+    for path in paths:
+        filenames = [path] if os.path.isfile(path) else []
+        for base_path, _, walk_filenames in os.walk(path):
+            filenames.extend(os.path.join(base_path, filename) for filename in walk_filenames if filename.endswith(".py"))
+        for filename in filenames:
+            try:
+                with tokenize.open(filename) as f:
+                    names.extend(token.string for token in tokenize.generate_tokens(f.readline) if token.type == tokenize.NAME)
+            except (OSError, SyntaxError, UnicodeDecodeError, tokenize.TokenError):
+                continue
+    return names
+
+
+# The setup runs before each timed run, outside the timing.
+def measure(function, names, repeat, setup="pass"):
+    def run():
+        for name in names:
+            function(name)
+    return min(timeit.repeat(run, setup=setup, number=1, repeat=repeat)) / len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the naming rules of the Ultimaker style checker")
+    parser.add_argument("paths", type=str, nargs="*", help="List of paths to collect identifiers from (files or directories)", default=["."])
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs to take the fastest of")
+    args = parser.parse_args()
+
+    names = collectNames(args.paths)
+    if not names:
+        print("No identifiers found")
+        return 1
+    print("%d identifiers, %d unique" % (len(names), len(set(names))))
+
+    for rule_name, pattern, cached_match in RULES:
+        # The hit rate of a single pass over the identifiers, as a check run sees them.
+        cached_match.cache_clear()
+        for name in names:
+            cached_match(name)
+        info = cached_match.cache_info()
+        hit_rate = info.hits / (info.hits + info.misses)
+
+        uncached = measure(pattern.match, names, args.repeat)
+        # Every run starts with an empty cache, so it has the hit rate above and not the 100% of a warm cache.
+        cached = measure(cached_match, names, args.repeat, setup=cached_match.cache_clear)
+        print("%-9s regex: %6.1f ns  cached: %6.1f ns  (%.1fx, %.1f%% hits)" % (rule_name, uncached * 1e9, cached * 1e9, uncached / cached, hit_rate * 100))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
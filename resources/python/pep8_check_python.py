@@ -7,8 +7,24 @@
 import pep8
 import re
 import os
+import ast
+import time
+import io
 import sys
+import json
+import types
+import fnmatch
+import hashlib
+import datetime
 import argparse
+import functools
+import stat
+import socket
+import threading
+import socketserver
+import contextlib
+import subprocess
+import multiprocessing
 import token as token_type
 from xml.etree import ElementTree
 
@@ -18,12 +34,33 @@ PUBLIC_MEMBER_NAME_MATCH = re.compile(r'^[A-Z][a-zA-Z0-9]*_*$')
 MEMBER_NAME_MATCH = re.compile(r'^[a-z_][a-z0-9_]*$')
 VARIABLE_NAME_MATCH = re.compile(r'^([a-z_][a-z0-9_]*)|([A-Z][A-Z0-9_]*)$')
 
-indent_stack = []
+# Directories and files that are never checked, see ExcludeMatcher for the patterns. Virtualenvs are skipped as well.
+DEFAULT_EXCLUDES = [".git", ".hg", ".svn", ".tox", ".nox", ".venv", "__pycache__", "node_modules", "*.egg-info", ".pep8_check_cache", "/build", "/dist"]
+
+# Maximum number of names of which the result is remembered, per naming rule.
+NAME_CACHE_SIZE = 4096
+
+
+# Create a function that matches a name against the pattern and remembers the result. The same names (self, common
+# parameter names, members) are checked over and over again on a large tree, and a cache lookup is cheaper than a match.
+def _createCachedMatch(pattern):
+    @functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+    def matchName(name):
+        return pattern.match(name) is not None
+    return matchName
+
+
+isClassName = _createCachedMatch(CLASS_NAME_MATCH)
+isFunctionName = _createCachedMatch(FUNCTION_NAME_MATCH)
+isMemberName = _createCachedMatch(MEMBER_NAME_MATCH)
+isVariableName = _createCachedMatch(VARIABLE_NAME_MATCH)
 
 # Check the logical line to see if there is a class or function definition. When there is, check if this definition matches
 # The coding style set at Ultimaker.
-def checkNames(logical_line, physical_line, tokens, indent_level):
-    global indent_stack
+# The stack of enclosing definitions is kept in the checker_state, which pep8 provides per check for each checked file,
+# so no state is shared between files or between checkers running at the same time.
+def checkNames(logical_line, physical_line, tokens, indent_level, checker_state):
+    indent_stack = checker_state.setdefault("indent_stack", [])
     if logical_line != "":
         while indent_stack and indent_stack[-1][0] >= indent_level:
             indent_stack.pop()
@@ -39,7 +76,7 @@ def checkNames(logical_line, physical_line, tokens, indent_level):
         idx += 1
     if tokens[idx].string == "def":
         idx += 1
-        if not FUNCTION_NAME_MATCH.match(tokens[idx].string):
+        if not isFunctionName(tokens[idx].string):
             yield tokens[idx].start, "U101 Function name not properly formatted with lower camel case"
         idx += 1
         if tokens[idx].string != "(":
@@ -52,7 +89,7 @@ def checkNames(logical_line, physical_line, tokens, indent_level):
                     idx += 1
                 if tokens[idx].string == "**":
                     idx += 1
-                if not VARIABLE_NAME_MATCH.match(tokens[idx].string):
+                if not isVariableName(tokens[idx].string):
                     yield tokens[idx].start, "U201 Function parameter not in lower_case_underscore_format"
                 idx += 1
                 if tokens[idx].string == "=":
@@ -69,17 +106,17 @@ def checkNames(logical_line, physical_line, tokens, indent_level):
                 idx += 1
     elif tokens[idx].string == "class":
         idx += 1
-        if not CLASS_NAME_MATCH.match(tokens[idx].string):
+        if not isClassName(tokens[idx].string):
             yield tokens[idx].start, "U103 Class name not properly formatted with upper camel case"
     elif len(tokens) > idx + 3 and tokens[idx].string == "self" and tokens[idx + 1].string == "." and tokens[idx + 3].string == "=":
-        if not MEMBER_NAME_MATCH.match(tokens[idx + 2].string):
+        if not isMemberName(tokens[idx + 2].string):
             yield tokens[idx + 2].start, "U202 Member name not in lower_case_underscore_format"
     elif len(tokens) > idx + 2 and tokens[idx + 1].string == "=":
         if len(indent_stack) > 1 and indent_stack[-2][1].startswith("class "):
             # definition is a class member
             if tokens[idx].string.startswith("_"):
                 # class member is a private, match the member name style.
-                if not MEMBER_NAME_MATCH.match(tokens[idx].string):
+                if not isMemberName(tokens[idx].string):
                     yield tokens[idx].start, "U202 Member name not in lower_case_underscore_format"
             else:
                 # TODO, the conding standard for this is not defined yet. And there are a few variations used in the code.
@@ -88,10 +125,75 @@ def checkNames(logical_line, physical_line, tokens, indent_level):
                 pass
         else:
             # definition is a variable
-            if not VARIABLE_NAME_MATCH.match(tokens[idx].string):
+            if not isVariableName(tokens[idx].string):
                 yield tokens[idx].start, "U203 Variable name not in lower_case_underscore_format"
 
 
+# Statements that have no body, and the fields of compound statements that hold statements.
+_SIMPLE_STATEMENTS = (ast.Expr, ast.Return, ast.AugAssign, ast.Import, ast.ImportFrom, ast.Pass, ast.Raise, ast.Assert, ast.Delete, ast.Global, ast.Nonlocal, ast.Break, ast.Continue)
+_BODY_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+
+
+# Check the class and function definitions and the assignments in the syntax tree of a file against the coding style set
+# at Ultimaker. This reports the same violations as checkNames, but parses each file once instead of walking the tokens
+# of every logical line, so parameters with annotations or keyword-only parameters are not reported as parsing errors.
+# Violations on a line with "# [CodeStyle: " are dropped by StyleChecker.check_ast.
+class NameChecker:
+    def __init__(self, tree, filename):
+        self._tree = tree
+        self._errors = []
+
+    def run(self):
+        self._checkBody(self._tree.body, False)
+        for line_number, offset, text in self._errors:
+            yield line_number, offset, text, type(self)
+
+    # Check a list of statements. Definitions can only be nested in the bodies of other statements, so expressions and
+    # other parts of the tree are never visited.
+    def _checkBody(self, body, in_class):
+        for node in body:
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    self._checkTarget(target, in_class)
+            elif isinstance(node, ast.AnnAssign):
+                self._checkTarget(node.target, in_class)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self._checkFunction(node)
+                self._checkBody(node.body, False)
+            elif isinstance(node, ast.ClassDef):
+                if not isClassName(node.name):
+                    self._errors.append((node.lineno, node.col_offset + len("class "), "U103 Class name not properly formatted with upper camel case"))
+                self._checkBody(node.body, True)
+            elif not isinstance(node, _SIMPLE_STATEMENTS):
+                # Compound statements, exception handlers and match cases.
+                for field in _BODY_FIELDS:
+                    statements = getattr(node, field, None)
+                    if statements:
+                        self._checkBody(statements, False)
+
+    def _checkFunction(self, node):
+        keyword = "async def " if isinstance(node, ast.AsyncFunctionDef) else "def "
+        if not isFunctionName(node.name):
+            self._errors.append((node.lineno, node.col_offset + len(keyword), "U101 Function name not properly formatted with lower camel case"))
+        arguments = node.args
+        parameters = arguments.posonlyargs + arguments.args + [arguments.vararg] + arguments.kwonlyargs + [arguments.kwarg]
+        for parameter in parameters:
+            if parameter is not None and not isVariableName(parameter.arg):
+                self._errors.append((parameter.lineno, parameter.col_offset, "U201 Function parameter not in lower_case_underscore_format"))
+
+    def _checkTarget(self, target, in_class):
+        if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == "self":
+            if not isMemberName(target.attr):
+                self._errors.append((target.end_lineno, target.end_col_offset - len(target.attr), "U202 Member name not in lower_case_underscore_format"))
+        elif isinstance(target, ast.Name):
+            if in_class:
+                # Only private class members have a defined style, see checkNames.
+                if target.id.startswith("_") and not isMemberName(target.id):
+                    self._errors.append((target.lineno, target.col_offset, "U202 Member name not in lower_case_underscore_format"))
+            elif not isVariableName(target.id):
+                self._errors.append((target.lineno, target.col_offset, "U203 Variable name not in lower_case_underscore_format"))
+
+
 # Check the string definitions in the line. All strings should be double quotes.
 def checkStrings(logical_line, tokens):
     for token in tokens:
@@ -107,10 +209,23 @@ def blankLines(logical_line, blank_lines, indent_level, line_number, blank_befor
             yield 0, "U302 expected 2 blank lines, found 0"
 
 
+# Report that also writes the violations as JUnit XML. Each file is written as a testsuite as soon as it has been
+# checked, so only the violations of the current file are kept in memory.
+# Without an xml_file in the options, the testsuites are kept in memory instead, for checkFilesParallel to collect.
 class XmlReport(pep8.StandardReport):
     def __init__(self, options):
         super().__init__(options)
-        self._error_files = {}
+        self._xml_file = getattr(options, "xml_file", None)
+        self._xml_output = None
+        self._file_errors = []
+        self._file_start_time = 0
+        self.testsuites = []
+        self.testsuite_count = 0
+
+    def init_file(self, filename, lines, expected, line_offset):  # [CodeStyle: overrides pep8.StandardReport.init_file]
+        self._file_errors = []
+        self._file_start_time = time.time()
+        return super().init_file(filename, lines, expected, line_offset)
 
     def error(self, line_number, offset, text, check):
         super().error(line_number, offset, text, check)
@@ -119,53 +234,295 @@ class XmlReport(pep8.StandardReport):
         if self._ignore_code(code):
             return
         
-        if self.filename not in self._error_files:
-            self._error_files[self.filename] = []
         lines = self.lines[line_number-2:line_number+2]
         lines.insert(2, (" " * offset) + "^\n")
-        self._error_files[self.filename].append((line_number, text, lines))
-    
-    def getJUnitXml(self):
-        xml = ElementTree.Element("testsuites")
-        xml.text = "\n"
-        for filename, data in self._error_files.items():
-            testsuite = ElementTree.SubElement(xml, "testsuite", {"name": filename, "errors": "0", "tests": str(len(data)), "failures": str(len(data)), "time": "0", "timestamp":"2013-05-24T10:23:58"})
-            testsuite.text = "\n"
-            testsuite.tail = "\n"
-            for line_number, text, lines in data:
-                testcase = ElementTree.SubElement(testsuite, "testcase", {"classname": "%s.line_%d" % (filename, line_number), "name": text})
-                testcase.text = "\n"
-                testcase.tail = "\n"
-                failure = ElementTree.SubElement(testcase, "failure", {"message": "test failure"})
-                failure.text = "".join(lines)
-                failure.tail = "\n"
-
-        if len(self._error_files) < 1:
+        self._file_errors.append((line_number, text, lines))
+
+    def get_file_results(self):  # [CodeStyle: overrides pep8.StandardReport.get_file_results]
+        if self._file_errors:
+            elapsed = time.time() - self._file_start_time
+            self.writeTestSuite(self._createTestSuite(self.filename, self._file_errors, elapsed))
+            self._file_errors = []
+        return super().get_file_results()
+
+    def _createTestSuite(self, filename, data, elapsed):
+        timestamp = datetime.datetime.fromtimestamp(self._file_start_time).strftime("%Y-%m-%dT%H:%M:%S")
+        testsuite = ElementTree.Element("testsuite", {"name": filename, "errors": "0", "tests": str(len(data)), "failures": str(len(data)), "time": "%.3f" % elapsed, "timestamp": timestamp})
+        testsuite.text = "\n"
+        testsuite.tail = "\n"
+        for line_number, text, lines in data:
+            testcase = ElementTree.SubElement(testsuite, "testcase", {"classname": "%s.line_%d" % (filename, line_number), "name": text})
+            testcase.text = "\n"
+            testcase.tail = "\n"
+            failure = ElementTree.SubElement(testcase, "failure", {"message": "test failure"})
+            failure.text = "".join(lines)
+            failure.tail = "\n"
+        return ElementTree.tostring(testsuite, encoding="unicode")
+
+    # Write a serialized testsuite to the XML file, which is opened on the first write.
+    def writeTestSuite(self, testsuite):
+        self.testsuite_count += 1
+        if self._xml_file is None:
+            self.testsuites.append(testsuite)
+            return
+        if self._xml_output is None:
+            self._xml_output = open(self._xml_file, "w", encoding="utf-8")
+            self._xml_output.write("<?xml version='1.0' encoding='utf-8'?>\n<testsuites>\n")
+        self._xml_output.write(testsuite)
+
+    # Finish the XML file. This has to be called once all files are checked.
+    def close(self):
+        if self.testsuite_count < 1:
             # Add a single test that is always succesful, as jenkins will complain if there are no tests found at all.
-            testsuite = ElementTree.SubElement(xml, "testsuite", {"name": "success", "errors": "0", "tests": "1", "failures": "0", "time": "0", "timestamp":"2013-05-24T10:23:58"})
+            testsuite = ElementTree.Element("testsuite", {"name": "success", "errors": "0", "tests": "1", "failures": "0", "time": "0", "timestamp": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")})
             testsuite.text = "\n"
             testsuite.tail = "\n"
             testcase = ElementTree.SubElement(testsuite, "testcase", {"classname": "success", "name": "success"})
             testcase.text = "\n"
             testcase.tail = "\n"
+            self.writeTestSuite(ElementTree.tostring(testsuite, encoding="unicode"))
+        if self._xml_output is not None:
+            self._xml_output.write("</testsuites>")
+            self._xml_output.close()
+            self._xml_output = None
 
-        return ElementTree.ElementTree(xml)
 
+# The result cache is kept per user, outside of the checked out repositories. As the entries are keyed on the file
+# content, checkouts can share it.
+def getDefaultCacheDirectory():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "pep8_check_python")
 
-def main():
-    parser = argparse.ArgumentParser(description="pep8 Ultimaker style checker")
-    parser.add_argument("paths", type=str, nargs="*", help="List of paths to check (files or directories)", default=["."])
-    parser.add_argument("--xml", type=str, help="Output JUnit XML file")
-    args = parser.parse_args()
 
+# On disk cache of the violations found per file. Entries are keyed on the file content, the version of this script
+# and pep8, the selected and ignored codes and the naming engine, so a changed file or changed rule set never replays stale results.
+class ResultCache:
+    def __init__(self, directory, max_size, select, ignore, naming_engine):
+        self._directory = directory
+        self._max_size = max_size
+        with open(__file__, "rb") as f:
+            checker_hash = hashlib.sha256(f.read()).hexdigest()
+        self._key_prefix = "%s:%s:%s:%s:%s" % (checker_hash, pep8.__version__, ",".join(sorted(select)), ",".join(sorted(ignore)), naming_engine)
+
+    def getKey(self, lines):
+        key_hash = hashlib.sha256(self._key_prefix.encode("utf-8"))
+        key_hash.update("".join(lines).encode("utf-8", "surrogateescape"))
+        return key_hash.hexdigest()
+
+    def _getPath(self, key):
+        return os.path.join(self._directory, key[:2], key + ".json")
+
+    # Get the cached result for the key, or None if there is none.
+    def load(self, key):
+        path = self._getPath(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)  # Keep recently used entries from being evicted.
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def store(self, key, result):
+        path = self._getPath(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first, so other processes never read a partially written entry.
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+        except OSError:
+            pass  # The cache is only an optimization, failing to write it should not fail the check.
+
+    # Remove the least recently used entries until the cache fits within its maximum size.
+    def evict(self):
+        entries = []
+        total_size = 0
+        for base_path, _, filenames in os.walk(self._directory):
+            for filename in filenames:
+                path = os.path.join(base_path, filename)
+                try:
+                    entry_stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, path))
+                total_size += entry_stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+
+# Cumulative wall time and number of calls per check, and wall time per file, collected with --profile.
+class CheckProfile:
+    def __init__(self):
+        self.checks = {}  # Name of the check to a list of the seconds spent in it and the number of calls.
+        self.files = {}  # Filename to the seconds spent checking it.
+
+    def addCheck(self, name, seconds):
+        check = self.checks.get(name)
+        if check is None:
+            check = self.checks[name] = [0.0, 0]
+        check[0] += seconds
+        check[1] += 1
+
+    def addFile(self, filename, seconds):
+        self.files[filename] = self.files.get(filename, 0.0) + seconds
+
+    def merge(self, other):
+        for name, (seconds, calls) in other.checks.items():
+            check = self.checks.setdefault(name, [0.0, 0])
+            check[0] += seconds
+            check[1] += calls
+        for filename, seconds in other.files.items():
+            self.addFile(filename, seconds)
+
+    def printSummary(self, file_count):
+        total = sum(self.files.values())
+        print("Time per check:")
+        for name, (seconds, calls) in sorted(self.checks.items(), key=lambda item: -item[1][0]):
+            print("%9.3fs %5.1f%% %9d calls  %s" % (seconds, seconds * 100 / total if total else 0, calls, name))
+        other = total - sum(seconds for seconds, _ in self.checks.values())
+        print("%9.3fs %5.1f%% %15s  other: reading, tokenizing and pep8 bookkeeping" % (other, other * 100 / total if total else 0, ""))
+        print("Slowest files:")
+        for filename, seconds in sorted(self.files.items(), key=lambda item: -item[1])[:file_count]:
+            print("%9.3fs  %s" % (seconds, filename))
+        print("Total: %.3fs in %d files" % (total, len(self.files)))
+
+    def writeJson(self, path):
+        data = {
+            "checks": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.checks.items()},
+            "files": self.files
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+
+
+# Checker that replays the violations of files that are in the result cache instead of checking them again, and that
+# only reports violations on the changed lines of a file when those are given.
+class StyleChecker(pep8.Checker):
+    def __init__(self, filename=None, lines=None, options=None, report=None, **kwargs):
+        super().__init__(filename, lines, options, report, **kwargs)
+        self._result_cache = getattr(options, "result_cache", None)
+
+        self._profile = getattr(options, "profile", None)
+        if self._profile is not None:
+            # Only replace the pep8 check dispatch when profiling, so checking without it does not pay for the timing.
+            self.run_check = self._runProfiledCheck
+
+        changed_lines = getattr(options, "changed_lines", None)
+        if changed_lines is not None:
+            file_changed_lines = changed_lines.get(os.path.realpath(self.filename))
+            if file_changed_lines is not None:
+                report_error = self.report_error
+
+                def reportChangedLineError(line_number, offset, text, check):
+                    if line_number in file_changed_lines:
+                        return report_error(line_number, offset, text, check)
+
+                self.report_error = reportChangedLineError
+
+    def check_all(self, expected=None, line_offset=0):  # [CodeStyle: overrides pep8.Checker.check_all]
+        if self._profile is not None:
+            start_time = time.perf_counter()
+            file_results = self._checkAll(expected, line_offset)
+            self._profile.addFile(self.filename, time.perf_counter() - start_time)
+            return file_results
+        return self._checkAll(expected, line_offset)
+
+    def _checkAll(self, expected, line_offset):
+        if self._result_cache is None or self._io_error:
+            return super().check_all(expected, line_offset)
+
+        key = self._result_cache.getKey(self.lines)
+        result = self._result_cache.load(key)
+        if result is not None:
+            self.report.init_file(self.filename, self.lines, expected, line_offset)
+            self.report.counters["logical lines"] += result["logical_lines"]
+            for line_number, offset, text in result["errors"]:
+                self.report_error(line_number, offset, text, None)
+            return self.report.get_file_results()
+
+        errors = []
+        report_error = self.report_error
+
+        def recordError(line_number, offset, text, check):
+            errors.append((line_number, offset, text))
+            return report_error(line_number, offset, text, check)
+
+        self.report_error = recordError
+        logical_lines = self.report.counters["logical lines"]
+        file_results = super().check_all(expected, line_offset)
+        self.report_error = report_error
+        self._result_cache.store(key, {"logical_lines": self.report.counters["logical lines"] - logical_lines, "errors": errors})
+        return file_results
+
+    def check_ast(self):  # [CodeStyle: overrides pep8.Checker.check_ast]
+        report_error = self.report_error
+
+        # Allow for violations in the coding style in rare cases, like checkNames does for logical lines.
+        def reportUnexemptedError(line_number, offset, text, check):
+            if line_number > len(self.lines) or "# [CodeStyle: " not in self.lines[line_number - 1]:
+                return report_error(line_number, offset, text, check)
+
+        self.report_error = reportUnexemptedError
+        start_time = time.perf_counter()
+        try:
+            super().check_ast()
+        finally:
+            self.report_error = report_error
+            if self._profile is not None:
+                # Building the syntax tree is shared by the tree checks, so it is included in their time.
+                self._profile.addCheck(", ".join(name for name, _, _ in self._ast_checks), time.perf_counter() - start_time)
+
+    # Run a physical or logical line check and record its time. Logical line checks are generators, which are consumed
+    # here so the time spent in them is recorded as well.
+    def _runProfiledCheck(self, check, argument_names):
+        start_time = time.perf_counter()
+        result = pep8.Checker.run_check(self, check, argument_names)
+        if isinstance(result, types.GeneratorType):
+            result = list(result)
+        self._profile.addCheck(check.__name__, time.perf_counter() - start_time)
+        return result
+
+
+# Create the style guide with the Ultimaker checks registered and the Ultimaker selection of pep8 checks.
+# The naming_engine selects whether names are checked with checkNames ("tokens") or with NameChecker ("ast").
+def createStyleGuide(reporter=None, result_cache=None, changed_lines=None, naming_engine="tokens", xml_file=None, profile=None):
     pep8.register_check(checkNames)
+    pep8.register_check(NameChecker)
     pep8.register_check(blankLines)
     pep8.register_check(checkStrings)
 
+    ignore = getIgnoredCodes()
+    critical = getSelectedCodes()
+
+    style_guide = pep8.StyleGuide(quiet=False, select=critical, ignore=ignore, show_source=True, reporter=reporter,
+                                  checker_class=StyleChecker, result_cache=result_cache, changed_lines=changed_lines,
+                                  naming_engine=naming_engine, xml_file=xml_file, profile=profile)
+    # The pep8 check registry is global, so drop the naming check of the other engine from this style guide only.
+    options = style_guide.options
+    if naming_engine == "ast":
+        options.logical_checks = [check for check in options.logical_checks if check[1] is not checkNames]
+    else:
+        options.ast_checks = [check for check in options.ast_checks if check[1] is not NameChecker]
+    return style_guide
+
+
+def getIgnoredCodes():
     ignore = []
     ignore.append("E501")  # Ignore line length violations.
     ignore.append("E226")  # Ignore too many leading # in comment block.
+    return ignore
 
+
+def getSelectedCodes():
     critical = []
     critical.append("E301")  # expected 1 blank line, found 0
     critical.append("U302")  # expected 2 blank lines, found 0
@@ -176,25 +533,417 @@ def main():
     critical.append("W191")  # indentation contains tabs
     critical.append("U9")    # Parsing errors (error in this script, or error in code that we're trying to parse)
     critical.append("U")     # All Ultimaker specific stuff.
+    return critical
 
-    pep8style = pep8.StyleGuide(quiet=False, select=critical, ignore=ignore, show_source=True)
-    if args.xml is not None:
-        pep8style.init_report(XmlReport)
-    for path in args.paths:
-        if path.endswith(".py") and "_pb2.py" not in path:
-            pep8style.paths.append(path)
-        for base_path, _, filenames in os.walk(path):
-            for filename in filenames:
-                if filename.endswith(".py") and "_pb2.py" not in filename:
-                    pep8style.paths.append(os.path.join(base_path, filename))
-    result = pep8style.check_files()
+
+# Style guide of a worker process when checking files in parallel, see checkFilesParallel.
+_worker_style_guide = None
+
+
+def _initWorker(reporter, result_cache, changed_lines, naming_engine, profile):
+    global _worker_style_guide
+    _worker_style_guide = createStyleGuide(reporter, result_cache, changed_lines, naming_engine, None, profile)
+
+
+# Check a single file in a worker process. The printed output is captured so the parent process can print it in order.
+def _checkFileInWorker(path):
+    report = _worker_style_guide.init_report()
+    if _worker_style_guide.options.profile is not None:
+        _worker_style_guide.options.profile = CheckProfile()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if not _worker_style_guide.excluded(path):
+            _worker_style_guide.input_file(path)
+    testsuites = report.testsuites if isinstance(report, XmlReport) else []
+    return output.getvalue(), report.counters, report.messages, report.total_errors, testsuites, _worker_style_guide.options.profile
+
+
+# Check the files over a pool of worker processes. The results are merged in the order of the paths, so the report
+# is the same as the one of pep8.StyleGuide.check_files.
+def checkFilesParallel(style_guide, paths, jobs):
+    options = style_guide.options
+    report = options.report
+    chunk_size = max(1, len(paths) // (jobs * 4))
+    report.start()
+    with multiprocessing.Pool(jobs, _initWorker, (options.reporter, options.result_cache, options.changed_lines, options.naming_engine, options.profile)) as pool:
+        for output, counters, messages, total_errors, testsuites, profile in pool.imap(_checkFileInWorker, paths, chunk_size):
+            sys.stdout.write(output)
+            for key, count in counters.items():
+                report.counters[key] = report.counters.get(key, 0) + count
+            for code, message in messages.items():
+                report.messages.setdefault(code, message)
+            report.total_errors += total_errors
+            for testsuite in testsuites:
+                report.writeTestSuite(testsuite)
+            if profile is not None:
+                options.profile.merge(profile)
+    report.stop()
+    return report
+
+
+# Report that collects the violations of a single file instead of printing them, used by LintServer.
+class CollectReport(pep8.BaseReport):
+    def __init__(self, options):
+        super().__init__(options)
+        self.violations = []
+
+    def error(self, line_number, offset, text, check):
+        code = super().error(line_number, offset, text, check)
+        if code:
+            self.violations.append({"line": line_number, "column": offset + 1, "code": code, "text": text[5:]})
+        return code
+
+
+# Keeps a style guide warm to check files for clients on a Unix socket, so editors do not pay the startup costs of this
+# script on every save. Clients send one JSON object per line, either {"path": ...} to check a file on disk or
+# {"path": ..., "source": ...} to check the contents of an unsaved buffer, and get one JSON object per line back with
+# the "path" and a list of "violations". The results of files on disk are kept and re-checked in the background when
+# the files change, so most requests are answered without checking anything.
+class LintServer:
+    def __init__(self, style_guide, watch_interval):
+        self._style_guide = style_guide
+        self._watch_interval = watch_interval
+        self._results = {}  # Real path of a file on disk to the stat key of the checked version and its violations.
+        self._results_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def checkSource(self, filename, lines):
+        report = CollectReport(self._style_guide.options)
+        checker = StyleChecker(filename, lines=lines, options=self._style_guide.options, report=report)
+        checker.check_all()
+        return report.violations
+
+    def checkFile(self, path):
+        real_path = os.path.realpath(path)
+        try:
+            file_stat = os.stat(real_path)
+        except OSError:
+            with self._results_lock:
+                self._results.pop(real_path, None)
+            return None
+        stat_key = (file_stat.st_mtime_ns, file_stat.st_size)
+        with self._results_lock:
+            result = self._results.get(real_path)
+        if result is not None and result[0] == stat_key:
+            return result[1]
+
+        try:
+            lines = pep8.readlines(real_path)
+        except OSError:
+            # A directory, an unreadable file or a file that was removed after the stat.
+            with self._results_lock:
+                self._results.pop(real_path, None)
+            raise
+        violations = self.checkSource(path, lines)
+        with self._results_lock:
+            self._results[real_path] = (stat_key, violations)
+        return violations
+
+    def handleRequest(self, request):
+        path = request.get("path", "stdin")
+        if not isinstance(path, str) or not isinstance(request.get("source", ""), str):
+            return {"path": path, "error": "Invalid request: path and source must be strings"}
+        try:
+            if "source" in request:
+                violations = self.checkSource(path, request["source"].splitlines(True))
+            else:
+                violations = self.checkFile(path)
+        except OSError as e:
+            return {"path": path, "error": "Cannot read file: %s" % (e.strerror or e)}
+        except Exception as e:  # The unsaved buffers of editors are often incomplete code that the checks fail on.
+            return {"path": path, "error": "Cannot check file: %s: %s" % (type(e).__name__, e)}
+        if violations is None:
+            return {"path": path, "error": "File not found"}
+        return {"path": path, "violations": violations}
+
+    # Re-check the known files that changed on disk, so their results are ready before the next request for them.
+    def _watch(self):
+        while not self._stopped.wait(self._watch_interval):
+            with self._results_lock:
+                paths = list(self._results)
+            for path in paths:
+                try:
+                    self.checkFile(path)
+                except Exception:
+                    # Reported when the file is requested again, until then it is not checked in the background.
+                    with self._results_lock:
+                        self._results.pop(path, None)
+
+    # Remove the socket left behind by a server that did not shut down cleanly. Anything else at the path, like a source
+    # file or the socket of a server that is still running, is left alone.
+    @staticmethod
+    def _removeStaleSocket(socket_path):
+        try:
+            mode = os.stat(socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError("%s exists and is not a socket" % socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(socket_path)
+            except ConnectionRefusedError:
+                os.remove(socket_path)
+                return
+        raise FileExistsError("Another server is serving on %s" % socket_path)
+
+    def serve(self, socket_path):
+        server = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):  # [CodeStyle: overrides socketserver.BaseRequestHandler.handle]
+                for line in self.rfile:
+                    try:
+                        response = server.handleRequest(json.loads(line.decode("utf-8")))
+                    except (ValueError, AttributeError) as e:
+                        response = {"error": "Invalid request: %s" % e}
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        self._removeStaleSocket(socket_path)
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as unix_server:
+            unix_server.daemon_threads = True
+            print("Serving on %s" % socket_path)
+            try:
+                unix_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self._stopped.set()
+                os.remove(socket_path)
+
+
+# Get the lines that were added or changed since the base revision, per file, using the git repository in the current
+# directory. Files are keyed on their real path, untracked files are included with None to indicate all lines changed.
+def getChangedLines(base):
+    root = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], universal_newlines=True, stderr=subprocess.PIPE).strip()
+    diff = subprocess.check_output(["git", "-c", "core.quotePath=false", "diff", "--no-color", "--no-ext-diff", "--no-renames", "--diff-filter=d", "-U0", base, "--"],
+                                   cwd=root, universal_newlines=True, stderr=subprocess.PIPE)
+    changed_lines = {}
+    lines = None
+    # The removed and added lines of the current hunk that are still to come, an added "++ x" line looks like a header.
+    hunk_remaining = 0
+    for line in diff.splitlines():
+        if hunk_remaining > 0:
+            if not line.startswith("\\"):  # "\ No newline at end of file"
+                hunk_remaining -= 1
+        elif line.startswith("+++ "):
+            lines = set()
+            changed_lines[os.path.realpath(os.path.join(root, parseDiffPath(line[4:])))] = lines
+        elif line.startswith("@@ ") and lines is not None:
+            # Hunk header: @@ -start[,count] +start[,count] @@
+            removed, added = [part[1:].split(",") for part in line.split(" ")[1:3]]
+            start = int(added[0])
+            count = int(added[1]) if len(added) > 1 else 1
+            lines.update(range(start, start + count))
+            hunk_remaining = (int(removed[1]) if len(removed) > 1 else 1) + count
+
+    untracked = subprocess.check_output(["git", "ls-files", "--others", "--exclude-standard", "-z"], cwd=root, universal_newlines=True, stderr=subprocess.PIPE)
+    for filename in untracked.split("\0"):
+        if filename:
+            changed_lines[os.path.realpath(os.path.join(root, filename))] = None
+    return changed_lines
+
+
+# Get the path of the new file from the name in a "+++ b/path" diff header. Git ends names that contain a space with a
+# tab, and puts names with special characters in C style quotes ("b/na\"me"), with octal escapes for non-ASCII bytes.
+_DIFF_PATH_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, "\"": 34, "\\": 92}
+
+
+def parseDiffPath(name):
+    if name.endswith("\t"):
+        name = name[:-1]
+    if name.startswith("\"") and name.endswith("\""):
+        path = bytearray()
+        idx = 1
+        while idx < len(name) - 1:
+            if name[idx] != "\\":
+                path.extend(name[idx].encode("utf-8", "surrogateescape"))
+                idx += 1
+            elif name[idx + 1] in _DIFF_PATH_ESCAPES:
+                path.append(_DIFF_PATH_ESCAPES[name[idx + 1]])
+                idx += 2
+            else:
+                path.append(int(name[idx + 1:idx + 4], 8))
+                idx += 4
+        name = path.decode("utf-8", "surrogateescape")
+    return name[2:] if name.startswith("b/") else name
+
+
+# Get the Python files from the changed files that are within the given paths, relative to the current directory.
+def getChangedPaths(changed_lines, paths, excludes):
+    exclude_matcher = ExcludeMatcher(excludes)
+    roots = [os.path.realpath(path) for path in paths]
+    changed_paths = []
+    for filename in sorted(changed_lines):
+        if not isCheckedFile(filename) or exclude_matcher.isExcluded(os.path.relpath(filename)) or not os.path.isfile(filename):
+            continue
+        if any(filename == root or filename.startswith(os.path.join(root, "")) for root in roots):
+            changed_paths.append(os.path.relpath(filename))
+    return changed_paths
+
+
+def isCheckedFile(filename):
+    return filename.endswith(".py") and "_pb2.py" not in filename
+
+
+# Matches paths against exclude glob patterns, like .gitignore does: a pattern without a "/" matches the name of a
+# directory or file anywhere, a pattern with a "/" matches the path relative to the checked directory, and a leading "/"
+# only anchors a name to the checked directory. The patterns are combined into one regular expression per kind, as
+# matching every directory entry against each pattern separately with fnmatch is slower than listing the directory.
+class ExcludeMatcher:
+    def __init__(self, excludes):
+        self._name_match = self._compile([exclude for exclude in excludes if "/" not in exclude])
+        self._path_match = self._compile([exclude.lstrip("/") for exclude in excludes if "/" in exclude])
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return lambda path: None
+        return re.compile("|".join("(?:%s)" % fnmatch.translate(pattern.rstrip("/")) for pattern in patterns)).match
+
+    # Check a single directory entry, with its relative path separated by "/".
+    def isExcludedEntry(self, name, relative_path):
+        return bool(self._name_match(name) or self._path_match(relative_path))
+
+    # Check if the relative path or any of the directories it is in is excluded.
+    def isExcluded(self, relative_path):
+        names = os.path.normpath(relative_path).split(os.sep)
+        return any(self.isExcludedEntry(names[index], "/".join(names[:index + 1])) for index in range(len(names)))
+
+
+def _scanDirectory(directory, relative_directory, exclude_matcher, filenames):
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        relative_path = relative_directory + "/" + entry.name if relative_directory else entry.name
+        if exclude_matcher.isExcludedEntry(entry.name, relative_path):
+            continue  # Excluded directories are pruned here, so nothing below them is ever listed.
+        if entry.is_dir(follow_symlinks=False):
+            if not os.path.isfile(os.path.join(entry.path, "pyvenv.cfg")):  # Skip virtualenvs, whatever their name.
+                _scanDirectory(entry.path, relative_path, exclude_matcher, filenames)
+        elif isCheckedFile(entry.name) and entry.is_file():
+            filenames.append(entry.path)
+
+
+# List the files in the directory that git does not ignore, or None when the directory is not in a git repository.
+def _listGitFiles(directory, exclude_matcher):
+    try:
+        output = subprocess.check_output(["git", "-C", directory, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                                         stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    filenames = []
+    for relative_path in sorted(output.split("\0")):
+        if relative_path and isCheckedFile(relative_path) and not exclude_matcher.isExcluded(relative_path):
+            filename = os.path.join(directory, relative_path)
+            if os.path.isfile(filename):  # Files that are deleted but not staged are still listed by git.
+                filenames.append(filename)
+    return filenames
+
+
+# Find the Python files to check in the paths, without duplicates. Files that are given explicitly are always checked.
+# With use_gitignore, the files in git repositories are listed by git so everything it ignores is skipped as well.
+def findPythonFiles(paths, excludes, use_gitignore):
+    exclude_matcher = ExcludeMatcher(excludes)
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            directory_filenames = _listGitFiles(path, exclude_matcher) if use_gitignore else None
+            if directory_filenames is None:
+                directory_filenames = []
+                _scanDirectory(path, "", exclude_matcher, directory_filenames)
+            filenames.extend(directory_filenames)
+        elif isCheckedFile(path):
+            filenames.append(path)
+
+    unique_filenames = []
+    seen = set()
+    for filename in filenames:
+        filename = os.path.normpath(filename)
+        absolute_path = os.path.abspath(filename)
+        if absolute_path not in seen:
+            seen.add(absolute_path)
+            unique_filenames.append(filename)
+    return unique_filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pep8 Ultimaker style checker")
+    parser.add_argument("paths", type=str, nargs="*", help="List of paths to check (files or directories)", default=["."])
+    parser.add_argument("--xml", type=str, help="Output JUnit XML file")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes to check files with, 0 to use all cores")
+    parser.add_argument("--cache-dir", type=str, default=getDefaultCacheDirectory(), help="Directory to cache the results of unchanged files in (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=64, help="Maximum size of the result cache in megabytes")
+    parser.add_argument("--no-cache", action="store_true", help="Check every file again instead of using the result cache")
+    parser.add_argument("--diff", type=str, metavar="BASE", help="Only check the files that changed since the git revision BASE")
+    parser.add_argument("--changed-lines", action="store_true", help="With --diff, only report violations on changed lines")
+    parser.add_argument("--exclude", type=str, action="append", default=[], help="Glob of directories or files to skip, on top of %s" % ", ".join(DEFAULT_EXCLUDES))
+    parser.add_argument("--use-gitignore", action="store_true", help="Skip the files that git ignores in directories that are in a git repository")
+    parser.add_argument("--naming-engine", choices=["tokens", "ast"], default="tokens", help="Check names per logical line (tokens) or once per file on the syntax tree (ast)")
+    parser.add_argument("--profile", action="store_true", help="Print the time spent per check and the slowest files")
+    parser.add_argument("--profile-files", type=int, default=10, help="With --profile, number of slowest files to print")
+    parser.add_argument("--profile-json", type=str, help="With --profile, also write the times to this JSON file")
+    parser.add_argument("--serve", type=str, metavar="SOCKET", help="Keep running and check files for clients on the Unix socket SOCKET")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="With --serve, seconds between checks for changed files")
+    args = parser.parse_args()
+    if args.changed_lines and args.diff is None:
+        parser.error("--changed-lines requires --diff")
+
+    changed_lines = None
+    if args.diff is not None:
+        try:
+            changed_lines = getChangedLines(args.diff)
+        except (OSError, subprocess.CalledProcessError) as e:
+            parser.error("--diff %s: %s" % (args.diff, (getattr(e, "stderr", None) or str(e)).strip()))
+
+    profile = CheckProfile() if args.profile else None
+
+    result_cache = None
+    # Results replayed from the cache would hide the time spent in the checks, so the cache is not used when profiling.
+    if not args.no_cache and profile is None:
+        result_cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024, getSelectedCodes(), getIgnoredCodes(), args.naming_engine)
+
+    if args.serve is not None:
+        try:
+            LintServer(createStyleGuide(None, result_cache, None, args.naming_engine), args.watch_interval).serve(args.serve)
+        except FileExistsError as e:
+            parser.error(str(e))
+        if result_cache is not None:
+            result_cache.evict()
+        return 0
+
+    pep8style = createStyleGuide(XmlReport if args.xml is not None else None, result_cache, changed_lines if args.changed_lines else None, args.naming_engine, args.xml, profile)
+    excludes = DEFAULT_EXCLUDES + args.exclude
+    if changed_lines is not None:
+        pep8style.paths.extend(getChangedPaths(changed_lines, args.paths, excludes))
+    else:
+        pep8style.paths.extend(findPythonFiles(args.paths, excludes, args.use_gitignore))
+    jobs = args.jobs or os.cpu_count()
+    if jobs > 1:
+        result = checkFilesParallel(pep8style, pep8style.paths, jobs)
+    else:
+        result = pep8style.check_files()
     print("----------------------------------")
     result.print_statistics()
     total = result.get_count()
     print("Total: %d" % (total))
 
+    if profile is not None:
+        print("----------------------------------")
+        profile.printSummary(args.profile_files)
+        if args.profile_json is not None:
+            profile.writeJson(args.profile_json)
+
     if args.xml is not None:
-        result.getJUnitXml().write(args.xml, "utf-8", True)
+        result.close()
+
+    if result_cache is not None:
+        result_cache.evict()
 
     return total
 